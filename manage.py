@@ -1,7 +1,9 @@
 import os
-from flask_script import Manager
+from flask_script import Manager, Command
 from flask_migrate import Migrate, MigrateCommand
 from src.app import create_app, db
+from src.models import RevokedToken
+from src.explain import index_report, describe_scan
 from dotenv import load_dotenv, find_dotenv
 
 
@@ -14,5 +16,34 @@ migrate = Migrate(app=app, db=db)
 manager = Manager(app=app)
 manager.add_command('db', MigrateCommand)
 
+
+class Explain(Command):
+    """Report whether the queries of the read endpoints use indexes"""
+
+    def run(self):
+        missing = 0
+        for url, statement, uses_index, scans in index_report(app):
+            if not uses_index:
+                missing += 1
+            print(f"{'ok' if uses_index else 'NO INDEX':8} {url}")
+            for scan in scans:
+                print(f'         {describe_scan(scan)}')
+
+        if missing:
+            print(f'{missing} queries read a table without an index')
+
+
+manager.add_command('explain', Explain())
+
+
+class PruneTokens(Command):
+    """Delete the revoked tokens that have expired"""
+
+    def run(self):
+        print(f'{RevokedToken.prune()} expired tokens deleted')
+
+
+manager.add_command('prune_tokens', PruneTokens())
+
 if __name__ == '__main__':
     manager.run()
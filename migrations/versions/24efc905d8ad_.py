@@ -0,0 +1,32 @@
+"""add posts search_vector
+
+Revision ID: 24efc905d8ad
+Revises: f622b07d43cf
+Create Date: 2026-10-18 14:52:37.904116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '24efc905d8ad'
+down_revision = 'f622b07d43cf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated columns require PostgreSQL 12 or newer
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A')"
+        " || setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+        " || setweight(to_tsvector('english', coalesce(contents, '')), 'C')",
+        persisted=True
+    ), nullable=True))
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
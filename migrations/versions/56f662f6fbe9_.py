@@ -0,0 +1,29 @@
+"""add comments post listing index
+
+Revision ID: 56f662f6fbe9
+Revises: ade44e224bd2
+Create Date: 2026-10-18 10:12:41.512934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '56f662f6fbe9'
+down_revision = 'ade44e224bd2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_comments_post_id_created_at_id',
+        'comments',
+        ['post_id', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_created_at_id', table_name='comments')
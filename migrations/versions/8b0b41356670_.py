@@ -0,0 +1,36 @@
+"""add tag_counts table
+
+Revision ID: 8b0b41356670
+Revises: 9596ee228436
+Create Date: 2026-10-18 12:20:54.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b0b41356670'
+down_revision = '9596ee228436'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tag_counts',
+    sa.Column('tag', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('tag')
+    )
+    op.create_index('ix_tag_counts_count_tag', 'tag_counts', [sa.text('count DESC'), 'tag'], unique=False)
+    # Backfill the counts from the existing posts
+    op.execute(
+        'INSERT INTO tag_counts (tag, count) '
+        'SELECT tag, count(*) FROM posts, unnest(posts.tags) AS tag '
+        'GROUP BY tag'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tag_counts_count_tag', table_name='tag_counts')
+    op.drop_table('tag_counts')
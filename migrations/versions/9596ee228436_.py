@@ -0,0 +1,31 @@
+"""add posts favorites_count counter
+
+Revision ID: 9596ee228436
+Revises: 56f662f6fbe9
+Create Date: 2026-10-18 11:03:18.207531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9596ee228436'
+down_revision = '56f662f6fbe9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('favorites_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill the counter from the existing favorites
+    op.execute(
+        'UPDATE posts SET favorites_count = ('
+        'SELECT count(*) FROM favorites_assoc '
+        'WHERE favorites_assoc.post_id = posts.id'
+        ')'
+    )
+
+
+def downgrade():
+    op.drop_column('posts', 'favorites_count')
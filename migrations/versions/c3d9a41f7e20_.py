@@ -0,0 +1,62 @@
+"""add listing indexes
+
+Revision ID: c3d9a41f7e20
+Revises: 24efc905d8ad
+Create Date: 2026-10-18 16:03:12.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9a41f7e20'
+down_revision = '24efc905d8ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction, building
+    # the indexes this way doesn't lock the tables against writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_posts_created_at_id',
+            'posts',
+            ['created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_posts_owner_id_created_at_id',
+            'posts',
+            ['owner_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_favorites_assoc_post_id',
+            'favorites_assoc',
+            ['post_id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_favorites_assoc_post_id',
+            table_name='favorites_assoc',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'ix_posts_owner_id_created_at_id',
+            table_name='posts',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'ix_posts_created_at_id',
+            table_name='posts',
+            postgresql_concurrently=True
+        )
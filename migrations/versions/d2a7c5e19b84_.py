@@ -0,0 +1,24 @@
+"""add index on users avatar
+
+Revision ID: d2a7c5e19b84
+Revises: 4f0e8d6c1a37
+Create Date: 2026-10-18 21:04:12.538211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e19b84'
+down_revision = '4f0e8d6c1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_users_avatar'), 'users', ['avatar'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_avatar'), table_name='users')
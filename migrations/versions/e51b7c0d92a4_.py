@@ -0,0 +1,31 @@
+"""add posts comments_count counter
+
+Revision ID: e51b7c0d92a4
+Revises: c3d9a41f7e20
+Create Date: 2026-10-18 16:48:55.730162
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e51b7c0d92a4'
+down_revision = 'c3d9a41f7e20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill the counter from the existing comments
+    op.execute(
+        'UPDATE posts SET comments_count = ('
+        'SELECT count(*) FROM comments '
+        'WHERE comments.post_id = posts.id'
+        ')'
+    )
+
+
+def downgrade():
+    op.drop_column('posts', 'comments_count')
@@ -0,0 +1,24 @@
+"""add posts tags gin index
+
+Revision ID: f622b07d43cf
+Revises: 8b0b41356670
+Create Date: 2026-10-18 13:41:09.630417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f622b07d43cf'
+down_revision = '8b0b41356670'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_tags', 'posts', ['tags'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_posts_tags', table_name='posts')
@@ -1,10 +1,13 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_restful import Api
-from src.extensions import db, bcrypt, jwt, cors
+from src.extensions import db, password_hasher, jwt, cors, \
+    response_cache, revocation_store, rate_limiter
 from src.config import app_config
 from src.exceptions import InvalidUsage, error_handler
-from src.resources import UserRegister, UserLogin, UserMe, UserResource, \
-    PostsResource, PostResource, PostsByUserResource, \
+from src.resources import UserRegister, UserLogin, TokenRefresh, \
+    UserLogout, UserMe, UserResource, \
+    PostsResource, PostResource, PostSearchResource, PostsByUserResource, \
     CommentsResource, CommentResource, \
     FavoriteResource, FavoritePostsByUserResource, TagResource
 
@@ -14,14 +17,29 @@ def create_app(env_name):
     app.config.from_object(app_config[env_name])
     api = Api(app)
 
-    bcrypt.init_app(app)
+    # Behind reverse proxies, take the client's address from the
+    # X-Forwarded-For entry appended by the outermost trusted one
+    trusted_proxies = app.config.get('TRUSTED_PROXIES', 0)
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app,
+            x_for=trusted_proxies,
+            x_proto=trusted_proxies
+        )
+
+    password_hasher.init_app(app)
     db.init_app(app)
     jwt.init_app(app)
     cors.init_app(app)
+    response_cache.init_app(app)
+    revocation_store.init_app(app)
+    rate_limiter.init_app(app)
     app.errorhandler(InvalidUsage)(error_handler)
 
     api.add_resource(UserRegister, '/register')
     api.add_resource(UserLogin, '/login')
+    api.add_resource(TokenRefresh, '/token/refresh')
+    api.add_resource(UserLogout, '/logout')
     api.add_resource(UserMe, '/me')
     api.add_resource(UserResource, '/@<string:username>')
     api.add_resource(PostsByUserResource, '/@<string:username>/posts')
@@ -31,6 +49,7 @@ def create_app(env_name):
     )
     api.add_resource(TagResource, '/tags')
     api.add_resource(PostsResource, '/posts')
+    api.add_resource(PostSearchResource, '/posts/search')
     api.add_resource(PostResource, '/posts/<int:post_id>')
     api.add_resource(FavoriteResource, '/posts/<int:post_id>/favorite')
     api.add_resource(CommentsResource, '/posts/<int:post_id>/comments')
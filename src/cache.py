@@ -0,0 +1,282 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, current_app, has_app_context, json, Response
+
+
+class MemoryBackend(object):
+    """In-process LRU store, bounded by entry count and total bytes.
+
+    Tag versions live apart from the entries so evicting entries never
+    resets a version, which would bring stale entries back to life.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._size += len(value)
+            while len(self._entries) > self.max_entries or \
+                    self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_versions(self, tags):
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def incr(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+
+class TTLCache(object):
+    """Small in-process LRU mapping of objects expiring after ``ttl``."""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedBackend(object):
+    """Store shared by every process, on top of a redis-like client.
+
+    Only get, set (with ``ex``), mget and incr are used, so anything
+    speaking that subset of the redis API can serve it.
+    """
+
+    # The shared store evicts on its own, without telling
+    evictions = 0
+
+    def __init__(self, client, prefix='response-cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_versions(self, tags):
+        if not tags:
+            return []
+        versions = self.client.mget(
+            [f'{self.prefix}tag:{tag}' for tag in tags]
+        )
+        return [int(version or 0) for version in versions]
+
+    def incr(self, tag):
+        self.client.incr(f'{self.prefix}tag:{tag}')
+
+
+class _CacheState(object):
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class ResponseCache(object):
+    """Caches the JSON responses of anonymous GET requests.
+
+    Resources declare the tags their response depends on, and models
+    invalidate those tags whenever they change. An entry key embeds the
+    version of each of its tags at the time it's computed, so bumping a
+    version makes every entry depending on the tag unreachable at once.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        app.config.setdefault('RESPONSE_CACHE', None)
+        app.config.setdefault('RESPONSE_CACHE_URL', None)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+
+        if backend is None:
+            backend = self._create_backend(app.config)
+
+        app.extensions['response_cache'] = _CacheState(
+            backend, app.config['RESPONSE_CACHE_TTL']
+        )
+
+    @staticmethod
+    def _create_backend(config):
+        kind = config['RESPONSE_CACHE']
+        if kind == 'memory':
+            return MemoryBackend(
+                config['RESPONSE_CACHE_MAX_ENTRIES'],
+                config['RESPONSE_CACHE_MAX_BYTES']
+            )
+        if kind == 'shared':
+            # Only needed for the shared backend
+            import redis
+
+            return SharedBackend(
+                redis.Redis.from_url(config['RESPONSE_CACHE_URL'])
+            )
+        return None
+
+    @property
+    def _state(self):
+        if not has_app_context():
+            return None
+        state = current_app.extensions.get('response_cache')
+        if state is None or state.backend is None:
+            return None
+        return state
+
+    @property
+    def enabled(self):
+        return self._state is not None
+
+    def cacheable(self):
+        # Anything depending on who's asking isn't shared
+        return self.enabled and \
+            request.method == 'GET' and \
+            'Authorization' not in request.headers
+
+    def invalidate(self, *tags):
+        state = self._state
+        if state is None:
+            return
+        for tag in set(tags):
+            state.backend.incr(tag)
+
+    def respond(self, tags, produce, tags_of=None):
+        """Return the cached response for the current request, or the one
+        built from the ``(data, status_code)`` returned by ``produce``.
+
+        ``tags_of`` returns further tags from the data itself, for what
+        can't be known up front (like the authors of a page of posts).
+        Their versions are stored with the entry and checked on each hit.
+        """
+        state = self._state
+        tags = sorted(set(tags))
+        versions = state.backend.get_versions(tags)
+        key = hashlib.sha1(json.dumps(
+            [request.full_path, tags, versions]
+        ).encode('utf-8')).hexdigest()
+
+        entry = state.backend.get(key)
+        if entry is not None:
+            header, body = entry.split(b'\n', 1)
+            dependencies = json.loads(header)
+            if not dependencies or state.backend.get_versions(
+                list(dependencies)
+            ) == list(dependencies.values()):
+                state.count(hit=True)
+                return self._response(body, 200, 'HIT')
+
+        state.count(hit=False)
+        data, status_code = produce()
+        if isinstance(data, Response):
+            return data
+
+        body = json.dumps(data).encode('utf-8')
+        if status_code == 200:
+            # Read after producing the data, a change in between leaves
+            # the entry stale until it expires
+            extra = sorted(set(tags_of(data)) - set(tags)) \
+                if tags_of is not None else []
+            header = json.dumps(dict(zip(
+                extra, state.backend.get_versions(extra)
+            )))
+            state.backend.set(
+                key, header.encode('utf-8') + b'\n' + body, state.ttl
+            )
+
+        return self._response(body, status_code, 'MISS')
+
+    @staticmethod
+    def _response(body, status_code, outcome):
+        return Response(
+            body,
+            status=status_code,
+            mimetype='application/json',
+            headers={'X-Cache': outcome}
+        )
+
+    def stats(self):
+        state = self._state
+        if state is None:
+            return None
+        lookups = state.hits + state.misses
+        return {
+            'hits': state.hits,
+            'misses': state.misses,
+            'evictions': state.backend.evictions,
+            'hit_rate': state.hits / lookups if lookups else 0.0
+        }
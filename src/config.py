@@ -7,6 +7,9 @@ load_dotenv(find_dotenv())
 
 UPLOAD_FOLDER = './src/static/uploads/'
 TEST_UPLOAD_FOLDER = './src/static/testing/'
+# Larger requests are turned down before their body is read
+MAX_REQUEST_SIZE = 8 * 1024 * 1024
+MAX_AVATAR_SIZE = 5 * 1024 * 1024
 
 
 class Development(object):
@@ -14,9 +17,21 @@ class Development(object):
     TESTING = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=45)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # Lets refreshed access tokens get their claims without loading the user
+    JWT_CLAIMS_IN_REFRESH_TOKEN = True
+    JWT_BLACKLIST_ENABLED = True
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOADS_FOLDER = UPLOAD_FOLDER
+    MAX_CONTENT_LENGTH = MAX_REQUEST_SIZE
+    AVATAR_MAX_SIZE = MAX_AVATAR_SIZE
+    COMPILE_SCHEMAS = True
+    RESPONSE_CACHE = 'memory'
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 32))
+    RATELIMIT_STORAGE = 'memory'
 
 
 class Production(object):
@@ -24,17 +39,50 @@ class Production(object):
     TESTING = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=45)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # Lets refreshed access tokens get their claims without loading the user
+    JWT_CLAIMS_IN_REFRESH_TOKEN = True
+    JWT_BLACKLIST_ENABLED = True
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOADS_FOLDER = UPLOAD_FOLDER
+    MAX_CONTENT_LENGTH = MAX_REQUEST_SIZE
+    AVATAR_MAX_SIZE = MAX_AVATAR_SIZE
+    COMPILE_SCHEMAS = True
+    # An in-process cache can't be invalidated across workers, so only
+    # cache responses when they can be shared through redis
+    RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL')
+    RESPONSE_CACHE = 'shared' if RESPONSE_CACHE_URL else None
+    PASSWORD_HASH_WORKERS = int(
+        os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    )
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 32))
+    # Number of reverse proxies in front of the app, rate limits tell
+    # clients apart by the address they forward
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+    # Per process buckets let each worker grant the full limit, share
+    # them through redis when it's available
+    RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL')
+    RATELIMIT_STORAGE = 'shared' if RATELIMIT_STORAGE_URL else 'memory'
 
 
 class Testing(object):
     TESTING = True
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+    JWT_CLAIMS_IN_REFRESH_TOKEN = True
+    JWT_BLACKLIST_ENABLED = True
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_TEST_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOADS_FOLDER = TEST_UPLOAD_FOLDER
+    MAX_CONTENT_LENGTH = MAX_REQUEST_SIZE
+    AVATAR_MAX_SIZE = MAX_AVATAR_SIZE
+    COMPILE_SCHEMAS = True
+    RESPONSE_CACHE = None
+    # Hash inline, on the test's thread
+    PASSWORD_HASH_WORKERS = 0
+    RATELIMIT_STORAGE = 'memory'
 
 
 app_config = {
@@ -4,11 +4,18 @@ from flask import jsonify
 class InvalidUsage(Exception):
     status_code = 500
 
-    def __init__(self, status_code=500, message='Unknown error', payload=None):
+    def __init__(
+        self,
+        status_code=500,
+        message='Unknown error',
+        payload=None,
+        headers=None
+    ):
         Exception.__init__(self)
         self.message = message
         self.status_code = status_code
         self.payload = payload
+        self.headers = headers
 
     def to_dict(self):
         rv = dict()
@@ -21,6 +28,8 @@ class InvalidUsage(Exception):
 def error_handler(error):
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
+    if error.headers:
+        response.headers.extend(error.headers)
     return response
 
 
@@ -36,6 +45,12 @@ def invalid_token_handler(error):
     }, 401
 
 
+def revoked_token_handler():
+    return {
+        'message': 'Token has been revoked'
+    }, 401
+
+
 def expired_token_handler(error):
     return {
         'message': 'Session expired'
@@ -0,0 +1,106 @@
+import json
+from sqlalchemy import event
+from src.extensions import db
+from src.models import User, Post
+from src.pagination import encode_cursor
+
+
+def sample_urls():
+    # The read endpoints, filled in with whatever the database holds
+    urls = [
+        '/posts',
+        '/posts?tag=python',
+        '/posts?tag=python&tag=js&match=any',
+        '/posts/search?q=python',
+        '/tags',
+    ]
+
+    post = Post.query.order_by(Post.id).first()
+    if post:
+        cursor = encode_cursor(post.created_at, post.id)
+        urls += [
+            f'/posts?after={cursor}',
+            f'/posts/{post.id}',
+            f'/posts/{post.id}/comments',
+        ]
+
+    user = User.query.order_by(User.id).first()
+    if user:
+        urls += [
+            f'/@{user.username}',
+            f'/@{user.username}/posts',
+            f'/@{user.username}/favorites',
+        ]
+
+    return urls
+
+
+def captured_queries(app, url):
+    """Request ``url`` and return the SELECT statements it ran."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        app.test_client().get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    return statements
+
+
+def explain(statement, parameters):
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        # Small tables are cheaper to scan than to look up, so make the
+        # planner pick an index whenever there's one that can be used
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plan = cursor.fetchone()[0]
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return plan[0]['Plan']
+
+
+def _scans(plan):
+    # Bitmap index scans only name the index, their parent the table
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        yield plan
+    for child in plan.get('Plans', []):
+        yield from _scans(child)
+
+
+def describe_scan(scan):
+    description = scan['Node Type']
+    if 'Index Name' in scan:
+        description += f" using {scan['Index Name']}"
+    if 'Relation Name' in scan:
+        description += f" on {scan['Relation Name']}"
+    return description
+
+
+def index_report(app, urls=None):
+    """EXPLAIN the queries behind each url.
+
+    Returns (url, statement, uses_index, scans) tuples, ``uses_index``
+    being False as soon as one of the tables is read sequentially.
+    """
+    report = []
+    for url in urls or sample_urls():
+        for statement, parameters in captured_queries(app, url):
+            scans = list(_scans(explain(statement, parameters)))
+            uses_index = all(
+                scan['Node Type'] != 'Seq Scan' for scan in scans
+            )
+            report.append((url, statement, uses_index, scans))
+
+    return report
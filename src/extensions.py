@@ -1,21 +1,35 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from src.exceptions import missing_token_handler, invalid_token_handler, \
-    expired_token_handler
+    expired_token_handler, revoked_token_handler
+from src.pagination import PaginatedQuery
+from src.cache import ResponseCache, TTLCache
+from src.hashing import PasswordHasher
+from src.revocation import RevocationStore
+from src.ratelimit import RateLimiter
 
 
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+db = SQLAlchemy(query_class=PaginatedQuery)
+password_hasher = PasswordHasher()
 jwt = JWTManager()
 cors = CORS()
+response_cache = ResponseCache()
+# Column snapshots of the users loaded for authenticated requests, kept
+# short lived as other processes' changes only show up once they expire
+user_cache = TTLCache(max_entries=1024, ttl=60)
+revocation_store = RevocationStore()
+rate_limiter = RateLimiter()
 
 # Avoid circular references
-from src.utils import identity_loader, user_loader # noqa
+from src.utils import identity_loader, user_loader, claims_loader, \
+    token_in_blacklist # noqa
 
 jwt.user_identity_loader(identity_loader)
+jwt.user_claims_loader(claims_loader)
 jwt.user_loader_callback_loader(user_loader)
 jwt.unauthorized_loader(missing_token_handler)
 jwt.invalid_token_loader(invalid_token_handler)
 jwt.expired_token_loader(expired_token_handler)
+jwt.revoked_token_loader(revoked_token_handler)
+jwt.token_in_blacklist_loader(token_in_blacklist)
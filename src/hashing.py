@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.exceptions import InvalidUsage
+
+
+# Run in the worker processes, they report how long the hashing itself
+# took so the time spent queued can be told apart
+def _hash(password, rounds):
+    started = time.perf_counter()
+    pw_hash = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return pw_hash.decode('utf-8'), time.perf_counter() - started
+
+
+def _check(pw_hash, password):
+    started = time.perf_counter()
+    matches = bcrypt.checkpw(password, pw_hash)
+    return matches, time.perf_counter() - started
+
+
+class HashMetrics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def record(self, queue_wait, hash_time):
+        with self.lock:
+            self.count += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.hash_time_total += hash_time
+            self.hash_time_max = max(self.hash_time_max, hash_time)
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    def stats(self):
+        with self.lock:
+            count = self.count or 1
+            return {
+                'count': self.count,
+                'rejected': self.rejected,
+                'queue_wait_avg': self.queue_wait_total / count,
+                'queue_wait_max': self.queue_wait_max,
+                'hash_time_avg': self.hash_time_total / count,
+                'hash_time_max': self.hash_time_max
+            }
+
+
+class PasswordHasher(object):
+    """Hashes and checks passwords with bcrypt in a pool of processes.
+
+    bcrypt holds whichever thread runs it for the whole computation, so a
+    burst of logins would otherwise tie up every request worker. At most
+    PASSWORD_HASH_WORKERS hashes run at once, and once PASSWORD_HASH_QUEUE
+    more are waiting further requests fail right away with a 503. Zero
+    workers hashes inline on the request thread. A pool broken by a dying
+    worker is replaced and the hash retried once, then it's a 503 too.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.rounds = 10
+        self.metrics = HashMetrics()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 32)
+        app.config.setdefault('PASSWORD_HASH_ROUNDS', 10)
+
+        self.shutdown()
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.rounds = app.config['PASSWORD_HASH_ROUNDS']
+        self._slots = threading.BoundedSemaphore(
+            max(self.workers, 1) + app.config['PASSWORD_HASH_QUEUE']
+        )
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _get_executor(self):
+        # Started on first use, so the processes are forked from the
+        # process actually serving requests
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        # Only the broken one, another thread may have replaced it already
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _submit(self, func, *args):
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+        raise InvalidUsage(503, 'Server busy, try again later')
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self.metrics.reject()
+            raise InvalidUsage(503, 'Server busy, try again later')
+
+        started = time.perf_counter()
+        try:
+            if self.workers:
+                result, hash_time = self._submit(func, *args)
+            else:
+                result, hash_time = func(*args)
+        finally:
+            self._slots.release()
+
+        elapsed = time.perf_counter() - started
+        self.metrics.record(max(elapsed - hash_time, 0.0), hash_time)
+
+        return result
+
+    def generate_password_hash(self, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(
+            _check, pw_hash.encode('utf-8'), password.encode('utf-8')
+        )
@@ -1,9 +1,19 @@
-from flask import request, Response
+import hashlib
+from flask import request, Response, current_app, json
 from marshmallow import ValidationError
 from functools import wraps
-from flask_jwt_extended import verify_jwt_in_request_optional
+from flask_sqlalchemy import Pagination
+from sqlalchemy import inspect
+from sqlalchemy.orm import defer, noload, selectinload
+from flask_jwt_extended import verify_jwt_in_request_optional, \
+    current_user, get_jwt_identity
 from src.exceptions import InvalidUsage
-from src.schemas import get_pagination_schema
+from src.extensions import response_cache, rate_limiter
+from src.models import Post
+from src.pagination import CursorPagination
+from src.records import PostRecord
+from src.schemas import get_pagination_schema, get_schema
+from src.serializers import get_serializer
 
 
 def validate_with_schema(
@@ -34,55 +44,283 @@ def validate_with_schema(
     return decorator
 
 
+def _resolve_favorites(data, schema):
+    if isinstance(data, Post):
+        posts = [data]
+    elif isinstance(data, (Pagination, CursorPagination)):
+        posts = data.items
+    elif isinstance(data, list):
+        posts = data
+    elif 'posts' in schema.dump_fields:
+        # A user dumped along with their posts
+        posts = data.posts
+    else:
+        return
+
+    posts = [
+        post for post in posts if isinstance(post, (Post, PostRecord))
+    ]
+    if posts:
+        Post.resolve_favorited(posts, current_user)
+
+
 def _dumped_data(data, schema):
     # Return any custom response (commonly an error) as is,
     # without parsing it
     if isinstance(data, dict) or isinstance(data, Response):
         return data
+    _resolve_favorites(data, schema)
+    if current_app.config.get('COMPILE_SCHEMAS'):
+        return get_serializer(schema).dump(data)
     return schema.dump(data)
 
 
-def marshal_with_schema(schema, status_code=200, paginate=False):
+def _author_tags(data):
+    # Whatever shows authors depends on their profiles
+    if isinstance(data, list):
+        for item in data:
+            yield from _author_tags(item)
+    elif isinstance(data, dict):
+        author = data.get('author')
+        if isinstance(author, dict) and 'username' in author:
+            yield f"user:{author['username']}"
+        for key in ('data', 'posts'):
+            if key in data:
+                yield from _author_tags(data[key])
+
+
+def _cached(cache_tags, kwargs, produce):
+    # Serve anonymous requests from the response cache when the
+    # resource declared what its response depends on
+    if cache_tags is None or not response_cache.cacheable():
+        return produce()
+    if callable(cache_tags):
+        cache_tags = cache_tags(**kwargs)
+
+    return response_cache.respond(cache_tags, produce, _author_tags)
+
+
+def marshal_with_schema(
+    schema,
+    status_code=200,
+    paginate=False,
+    cache_tags=None
+):
+    pag_schema = get_pagination_schema(schema) if paginate else schema
+
     def decorator(func):
         @wraps(func)
         def inner(*data, **kwargs):
-            data = func(*data, **kwargs)
+            def produce():
+                return _dumped_data(
+                    func(*data, **kwargs), pag_schema
+                ), status_code
 
-            pag_schema = get_pagination_schema(schema) if paginate else schema
+            return _cached(cache_tags, kwargs, produce)
+        return inner
+    return decorator
 
-            return _dumped_data(data, pag_schema), status_code
+
+def cached(cache_tags, status_code=200):
+    # For resources returning plain JSON data rather than schema dumps
+    def decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            return _cached(
+                cache_tags,
+                kwargs,
+                lambda: (func(*args, **kwargs), status_code)
+            )
         return inner
     return decorator
 
 
+def _with_headers(response, headers):
+    if isinstance(response, Response):
+        response.headers.extend(headers)
+        return response
+    if not isinstance(response, tuple):
+        return response, 200, headers
+    if len(response) == 3:
+        data, status_code, response_headers = response
+        return data, status_code, {**headers, **response_headers}
+    data, status_code = response
+    return data, status_code, headers
+
+
+def rate_limit(scope, limit, period):
+    """Allow each client ``limit`` requests per ``period`` seconds.
+
+    Requests over the limit are turned down with a 429 before the
+    resource runs, so apply it after authentication (to limit by user)
+    but before any validation or other work.
+    """
+    def decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            current = rate_limiter.hit(scope, limit, period)
+            if current is None:
+                return func(*args, **kwargs)
+            if not current.allowed:
+                raise InvalidUsage(
+                    429,
+                    'Too many requests, try again later',
+                    headers=current.headers()
+                )
+
+            try:
+                response = func(*args, **kwargs)
+            except InvalidUsage as error:
+                # Failed attempts count too, let clients know
+                error.headers = {**current.headers(), **(error.headers or {})}
+                raise
+            return _with_headers(response, current.headers())
+        return inner
+    return decorator
+
+
+def _loader_options(model, schema_cls, excluded):
+    # Only pay for the fields that are going to be dumped: defer the
+    # excluded columns, skip the excluded relationships and load the
+    # included ones up front
+    mapper = inspect(model)
+    options = []
+    for name, field in schema_cls._declared_fields.items():
+        attr = field.attribute or name
+        if attr in mapper.relationships:
+            relationship = mapper.relationships[attr]
+            if relationship.lazy == 'dynamic':
+                continue
+            if name in excluded:
+                options.append(noload(getattr(model, attr)))
+            elif relationship.lazy not in ('joined', 'selectin'):
+                options.append(selectinload(getattr(model, attr)))
+        elif attr in mapper.column_attrs and name in excluded:
+            options.append(defer(getattr(model, attr)))
+
+    return options
+
+
 def dynamic_marshal_with_schema(
     schema_cls,
     default_excluded=[],
     status_code=200,
-    paginate=False
+    paginate=False,
+    model=None,
+    records=None,
+    cache_tags=None
 ):
+    """Dump the resource's data with only the fields asked for.
+
+    ``?include=`` toggles fields excluded by default and ``?exclude=``
+    leaves fields out. The resource is passed loader ``options`` for the
+    mapped ``model`` it queries, or the ``columns`` to select when it
+    builds plain ``records`` instead.
+    """
     def decorator(func):
         @wraps(func)
         def inner(*data, **kwargs):
+            return _cached(
+                cache_tags, kwargs, lambda: produce(*data, **kwargs)
+            )
+
+        def produce(*data, **kwargs):
             include_fields = request.args.getlist('include')
             excluded = set(
                 default_excluded
             ).symmetric_difference(set(
                 include_fields
-            ))
+            )).union(
+                request.args.getlist('exclude')
+            ).intersection(schema_cls._declared_fields)
+
+            # Let the resource build its query for the fields to dump
+            if records is not None:
+                kwargs['columns'] = records.columns(excluded)
+            elif model is not None:
+                kwargs['options'] = _loader_options(
+                    model, schema_cls, excluded
+                )
 
             data = func(*data, **kwargs)
             many = isinstance(data, list) or paginate
-            schema = schema_cls(exclude=excluded, many=many)
-
-            if paginate:
-                schema = get_pagination_schema(schema)
+            schema = get_schema(
+                schema_cls,
+                exclude=frozenset(excluded),
+                many=many,
+                paginate=paginate
+            )
 
             return _dumped_data(data, schema), status_code
         return inner
     return decorator
 
 
+def _body_conditional(response):
+    # Validated with a hash of the body it's about to send
+    if not isinstance(response, Response):
+        data, status_code, *headers = response
+        if status_code != 200:
+            return response
+        response = Response(
+            json.dumps(data),
+            status=status_code,
+            headers=headers[0] if headers else None,
+            mimetype='application/json'
+        )
+    if response.status_code != 200:
+        return response
+
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def conditional(get_version, cached=False):
+    """Answer with 304 Not Modified while the client's copy is current.
+
+    ``get_version`` receives the view arguments and returns values that
+    change whenever the response would, read with a much cheaper query
+    than the resource's own (a single row, or the keys of a page). They
+    make up the ETag along with the url and the requesting user, so a
+    matching client is answered before the resource runs at all.
+
+    Anonymous requests the response cache serves (``cached``) are
+    validated with a hash of the body instead, a hit needs no query.
+    """
+    def decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if cached and response_cache.cacheable():
+                return _body_conditional(func(*args, **kwargs))
+
+            version = get_version(**kwargs)
+            etag = hashlib.sha1(json.dumps(
+                [request.full_path, get_jwt_identity(), version],
+                default=str
+            ).encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = func(*args, **kwargs)
+            if isinstance(response, Response):
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                return response
+
+            data, status_code, *headers = response
+            if status_code != 200:
+                return response
+            return data, status_code, {
+                **(headers[0] if headers else {}),
+                'ETag': f'"{etag}"'
+            }
+        return inner
+    return decorator
+
+
 def valid_jwt_optional(fn):
     @wraps(fn)
     def inner(*args, **kwargs):
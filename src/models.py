@@ -1,11 +1,13 @@
 import datetime as dt
-from sqlalchemy import select, func, bindparam
+from collections import Counter
+from sqlalchemy import select, func, event, cast
+from sqlalchemy.sql import ClauseElement
 from flask import url_for
-from sqlalchemy.orm import column_property, aliased
+from sqlalchemy.orm import column_property, make_transient_to_detached
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.dialects.postgresql import ARRAY
-from flask_jwt_extended import current_user
-from src.extensions import db, bcrypt
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, insert
+from src.extensions import db, password_hasher, response_cache, \
+    user_cache
 
 
 favorites_assoc = db.Table(
@@ -15,9 +17,10 @@ favorites_assoc = db.Table(
     ),
     db.Column(
         'post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True
-    )
+    ),
+    # The primary key only serves lookups by user
+    db.Index('ix_favorites_assoc_post_id', 'post_id')
 )
-favaliased = aliased(favorites_assoc)
 
 
 class User(db.Model):
@@ -26,17 +29,22 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     bio = db.Column(db.String(300), nullable=True)
-    username = db.Column(db.String(128), nullable=False, unique=True)
+    # The previous username is kept when changed, to invalidate its tag
+    username = db.column_property(
+        db.Column(db.String(128), nullable=False, unique=True),
+        active_history=True
+    )
     email = db.Column(db.String(128), unique=True, nullable=False)
     password = db.Column(db.String(128), nullable=True)
-    avatar = db.Column(db.String(300), nullable=True)
+    avatar = db.Column(db.String(300), nullable=True, index=True)
     posts = db.relationship(
         'Post',
         # Eager load the author of each post using an INNER JOIN
         # NOTE: joined loading is more commonly used to load
         # many-to-one not null relationships, not collections
         backref=db.backref('author', lazy='joined', innerjoin=True),
-        lazy='dynamic'
+        # Loaded only when dumped, see dynamic_marshal_with_schema
+        lazy='select'
     )
     comments = db.relationship(
         'Comment',
@@ -61,8 +69,11 @@ class User(db.Model):
 
     def save(self):
         self.modified_at = dt.datetime.now()
+        cache_tags = self._cache_tags()
         db.session.add(self)
         db.session.commit()
+        user_cache.delete(self.id)
+        response_cache.invalidate(*cache_tags)
 
     def update(self, **kwargs):
         for attr, value in kwargs.items():
@@ -73,8 +84,20 @@ class User(db.Model):
         self.save()
 
     def delete(self):
+        cache_tags = self._cache_tags()
         db.session.delete(self)
         db.session.commit()
+        user_cache.delete(self.id)
+        response_cache.invalidate(*cache_tags)
+
+    def _cache_tags(self):
+        # Users are shown along with their profile, posts and comments,
+        # none of which can be cached before the user exists
+        state = db.inspect(self)
+        if not response_cache.enabled or not state.has_identity:
+            return []
+        usernames = {self.username, *state.attrs.username.history.deleted}
+        return [f'user:{username}' for username in usernames]
 
     @staticmethod
     def get_all():
@@ -89,8 +112,69 @@ class User(db.Model):
         return User.query.filter_by(email=email).first()
 
     @staticmethod
-    def get_by_username(username):
-        return User.query.filter_by(username=username).first()
+    def get_cached(_id):
+        # Served from a snapshot of the row when there's one, attached to
+        # the session without querying the database
+        columns = user_cache.get(_id)
+        if columns is None:
+            user = User.get_one(_id)
+            if user is not None:
+                user_cache.set(_id, {
+                    attr.key: getattr(user, attr.key)
+                    for attr in db.inspect(User).column_attrs
+                })
+            return user
+
+        user = db.inspect(User).class_manager.new_instance()
+        for key, value in columns.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def get_version(username, with_posts=False):
+        version = db.session.query(User.modified_at). \
+            filter_by(username=username). \
+            scalar()
+        if not with_posts or version is None:
+            return version
+
+        # Only the user's own posts, through the owner index
+        posts = Post.query. \
+            filter(Post.owner_id == User.id_of(username)). \
+            with_entities(
+                func.count(Post.id),
+                func.max(Post.modified_at),
+                func.sum(Post.comments_count)
+            ).one()
+        return (version, *posts)
+
+    @staticmethod
+    def id_of(username):
+        # Scalar subquery, to filter by user without loading them first
+        return select([User.id]).where(User.username == username).as_scalar()
+
+    @staticmethod
+    def lock_avatar(avatar):
+        # Serializes setting and deleting a picture until the transaction
+        # ends, across processes
+        db.session.execute(
+            select([func.pg_advisory_xact_lock(func.hashtext(avatar))])
+        )
+
+    @staticmethod
+    def avatar_in_use(avatar):
+        return db.session.query(
+            User.query.filter_by(avatar=avatar).exists()
+        ).scalar()
+
+    @staticmethod
+    def get_by_username(username, options=()):
+        return User.query. \
+            options(*options). \
+            filter_by(username=username). \
+            first()
 
     @property
     def picture(self):
@@ -103,13 +187,10 @@ class User(db.Model):
         return None
 
     def set_password(self, password):
-        self.password = bcrypt.generate_password_hash(
-            password,
-            rounds=10
-        ).decode('utf-8')
+        self.password = password_hasher.generate_password_hash(password)
 
     def check_hash(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        return password_hasher.check_password_hash(self.password, password)
 
     def __repr__(self):
         return f"<id {self.id}>"
@@ -117,12 +198,41 @@ class User(db.Model):
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Serves the tag filters (@> and &&) of the posts listing
+        db.Index('ix_posts_tags', 'tags', postgresql_using='gin'),
+        db.Index(
+            'ix_posts_search_vector', 'search_vector', postgresql_using='gin'
+        ),
+        # Newest first listings, of everyone and of a single user
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index(
+            'ix_posts_owner_id_created_at_id', 'owner_id', 'created_at', 'id'
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text, nullable=False)
     contents = db.Column(db.Text, nullable=False)
-    tags = db.Column(ARRAY(db.String))
+    # Keep the previous tags around on change to update the tag counts
+    tags = column_property(
+        db.Column(ARRAY(db.String)),
+        active_history=True
+    )
+    # Generated by the database from the weighted text columns, and only
+    # used for searching, so it's never loaded with the post
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        db.Computed(
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A')"
+            " || setweight("
+            "to_tsvector('english', coalesce(description, '')), 'B')"
+            " || setweight("
+            "to_tsvector('english', coalesce(contents, '')), 'C')",
+            persisted=True
+        )
+    ))
     comments = db.relationship(
         'Comment',
         backref='post',
@@ -136,9 +246,23 @@ class Post(db.Model):
         'User',
         secondary=favorites_assoc,
         backref=db.backref('favorites', lazy='dynamic'),
-        # Eager load the users who favorited this post using an
-        # additional SELECT IN query
-        lazy='selectin'
+        # Never load the users who favorited this post along with it,
+        # listings only need the denormalized favorites_count
+        lazy='dynamic'
+    )
+    _favorites_count = db.Column(
+        'favorites_count',
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+    # Maintained by Comment.save and Comment.delete
+    comments_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
     )
     created_at = db.Column(
         db.DateTime, nullable=False, default=dt.datetime.now
@@ -146,11 +270,23 @@ class Post(db.Model):
     modified_at = db.Column(
         db.DateTime, nullable=False, default=dt.datetime.now
     )
+    # Not stored, overlaid per request by Post.resolve_favorited
+    is_favorited = False
 
     def save(self):
         self.modified_at = dt.datetime.now()
+        history = db.inspect(self).attrs.tags.history
+        if history.has_changes():
+            TagCount.shift(
+                added=history.added[0] if history.added else None,
+                removed=history.deleted[0] if history.deleted else None
+            )
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(
+            *self._cache_tags(),
+            *(['tags'] if history.has_changes() else [])
+        )
 
     def update(self, **kwargs):
         for attr, value in kwargs.items():
@@ -158,19 +294,56 @@ class Post(db.Model):
         self.save()
 
     def delete(self):
+        cache_tags = self._cache_tags()
+        TagCount.shift(removed=self.tags)
         db.session.delete(self)
         db.session.commit()
+        response_cache.invalidate(*cache_tags, 'tags')
+
+    def _cache_tags(self):
+        # Listings, the post's own page and its author's profile
+        if not response_cache.enabled:
+            return []
+        return ['posts', f'post:{self.id}', f'user:{self.author.username}']
 
     def favorite(self, user):
-        self.favorited_by.append(user)
-        self.save()
+        # Write the association row directly instead of going through
+        # favorited_by, so no favoriter ever needs to be loaded
+        stmt = insert(favorites_assoc).values(
+            user_id=user.id,
+            post_id=self.id
+        ).on_conflict_do_nothing()
+
+        if db.session.execute(stmt).rowcount:
+            self._shift_favorites_count(1)
+            self.save()
+        else:
+            db.session.commit()
 
     def unfavorite(self, user):
-        try:
-            self.favorited_by.remove(user)
+        stmt = favorites_assoc.delete().where(
+            favorites_assoc.c.user_id == user.id
+        ).where(
+            favorites_assoc.c.post_id == self.id
+        )
+
+        if db.session.execute(stmt).rowcount:
+            self._shift_favorites_count(-1)
             self.save()
-        except ValueError:
-            pass
+        else:
+            db.session.commit()
+
+    def _shift_favorites_count(self, delta):
+        state = db.inspect(self)
+        count = state.dict.get('_favorites_count')
+        if state.persistent:
+            # Let the database apply the change so concurrent favorites
+            # don't overwrite each other
+            if not isinstance(count, ClauseElement):
+                count = Post._favorites_count
+        elif count is None:
+            count = 0
+        self._favorites_count = count + delta
 
     @staticmethod
     def get_all():
@@ -180,30 +353,177 @@ class Post(db.Model):
     def get_one(_id):
         return Post.query.get(_id)
 
+    @staticmethod
+    def tagged_with(tags, match_any=False):
+        # Both operators are served by the GIN index on posts.tags
+        tags = cast(tags, ARRAY(db.String))
+        if match_any:
+            return Post.tags.overlap(tags)
+        return Post.tags.contains(tags)
+
+    @staticmethod
+    def search(terms):
+        # Returns (post, headline) rows, most relevant first
+        query = func.websearch_to_tsquery('english', terms)
+        headline = func.ts_headline('english', Post.description, query)
+
+        return Post.query. \
+            add_columns(headline). \
+            filter(Post.search_vector.op('@@')(query)). \
+            order_by(
+                func.ts_rank(Post.search_vector, query).desc(),
+                Post.id.desc()
+            )
+
+    @staticmethod
+    def get_version(post_id):
+        # A single row, edits and favorites bump modified_at
+        return db.session.query(
+            Post.modified_at,
+            Post.comments_count,
+            User.modified_at
+        ).join(User, User.id == Post.owner_id). \
+            filter(Post.id == post_id). \
+            first()
+
+    @staticmethod
+    def resolve_favorited(posts, user):
+        # Look up which of the posts the user favorited with a single
+        # query, anonymous users can't have favorited anything
+        favorited = set()
+        if user and posts:
+            q = select([favorites_assoc.c.post_id]).where(
+                favorites_assoc.c.user_id == user.id
+            ).where(
+                favorites_assoc.c.post_id.in_([post.id for post in posts])
+            )
+            favorited = {post_id for post_id, in db.session.execute(q)}
+
+        for post in posts:
+            post.is_favorited = post.id in favorited
+
     @hybrid_property
     def favorites_count(self):
-        return len(self.favorited_by)
+        return self._favorites_count
+
+    @favorites_count.expression
+    def favorites_count(cls):
+        return cls._favorites_count
 
     def __repr__(self):
         return f"<id {self.id}>"
 
 
-Post.is_favorited = column_property(
-    select(
-        [func.count(favaliased.c.post_id) == 1]
-    ).where(
-        favaliased.c.post_id == Post.id
-    ).where(
-        favaliased.c.user_id == bindparam(
-            'current_user_id',
-            callable_=lambda: current_user.id if current_user else None
+@event.listens_for(Post.favorited_by, 'append')
+def _post_favorited(post, user, initiator):
+    post._shift_favorites_count(1)
+
+
+@event.listens_for(Post.favorited_by, 'remove')
+def _post_unfavorited(post, user, initiator):
+    post._shift_favorites_count(-1)
+
+
+class TagCount(db.Model):
+    __tablename__ = 'tag_counts'
+
+    tag = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def shift(added=None, removed=None):
+        # Apply the difference between two tag lists as a single upsert,
+        # in the transaction of the post being changed
+        delta = Counter(added or [])
+        delta.subtract(Counter(removed or []))
+        values = [
+            {'tag': tag, 'count': count}
+            for tag, count in delta.items() if count
+        ]
+        if not values:
+            return
+
+        stmt = insert(TagCount.__table__).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TagCount.tag],
+            set_={'count': TagCount.count + stmt.excluded.count}
         )
+        db.session.execute(stmt)
+
+    @staticmethod
+    def get_most_used(limit=None):
+        return TagCount.query. \
+            filter(TagCount.count > 0). \
+            order_by(TagCount.count.desc(), TagCount.tag). \
+            limit(limit). \
+            all()
+
+
+db.Index('ix_tag_counts_count_tag', TagCount.count.desc(), TagCount.tag)
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    token_type = db.Column(db.String(16), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    # In UTC, as the exp claim of the token
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(
+        db.DateTime, nullable=False, server_default=func.now(), index=True
     )
-)
+
+    @staticmethod
+    def revoke(jti, token_type, user_id, expires_at):
+        stmt = insert(RevokedToken.__table__).values(
+            jti=jti,
+            token_type=token_type,
+            user_id=user_id,
+            expires_at=expires_at
+        ).on_conflict_do_nothing()
+        db.session.execute(stmt)
+        db.session.commit()
+
+    @staticmethod
+    def is_revoked(jti):
+        return db.session.query(
+            RevokedToken.query.filter_by(jti=jti).exists()
+        ).scalar()
+
+    @staticmethod
+    def get_jtis(since=None):
+        # Tokens revoked since the given database time, expired ones are
+        # rejected regardless
+        query = db.session.query(RevokedToken.jti). \
+            filter(RevokedToken.expires_at > dt.datetime.utcnow())
+        if since is not None:
+            query = query.filter(RevokedToken.revoked_at >= since)
+        return [jti for jti, in query]
+
+    @staticmethod
+    def database_now():
+        return db.session.query(func.localtimestamp()).scalar()
+
+    @staticmethod
+    def prune():
+        # Expired tokens are rejected anyway, their rows aren't needed
+        count = RevokedToken.query. \
+            filter(RevokedToken.expires_at <= dt.datetime.utcnow()). \
+            delete(synchronize_session=False)
+        db.session.commit()
+        return count
 
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Serves the cursor paginated listing of a post's comments
+        db.Index(
+            'ix_comments_post_id_created_at_id',
+            'post_id', 'created_at', 'id'
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     contents = db.Column(db.Text, nullable=False)
@@ -222,8 +542,11 @@ class Comment(db.Model):
 
     def save(self):
         self.modified_at = dt.datetime.now()
+        if not db.inspect(self).persistent:
+            self._shift_comments_count(1)
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(*self._cache_tags())
 
     def update(self, **kwargs):
         for attr, value in kwargs.items():
@@ -231,5 +554,21 @@ class Comment(db.Model):
         self.save()
 
     def delete(self):
+        cache_tags = self._cache_tags()
+        self._shift_comments_count(-1)
         db.session.delete(self)
         db.session.commit()
+        response_cache.invalidate(*cache_tags)
+
+    def _cache_tags(self):
+        # Comments are listed on their post, which shows their count
+        if not response_cache.enabled:
+            return []
+        return Post.get_one(self.post_id)._cache_tags()
+
+    def _shift_comments_count(self, delta):
+        # Counted in the database, in the same transaction as the comment
+        Post.query.filter_by(id=self.post_id).update(
+            {Post.comments_count: Post.comments_count + delta},
+            synchronize_session=False
+        )
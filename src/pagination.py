@@ -0,0 +1,142 @@
+import json
+import base64
+import binascii
+import datetime as dt
+from flask import request
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import tuple_
+from src.exceptions import InvalidUsage
+
+
+def encode_cursor(created_at, _id):
+    raw = json.dumps([created_at.isoformat(), _id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    # An empty cursor (e.g. "?after=") just selects the first page
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        created_at, _id = json.loads(raw.decode('utf-8'))
+        return dt.datetime.fromisoformat(created_at), int(_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidUsage(400, 'Invalid cursor')
+
+
+def cursor_args(per_page, max_per_page, optional=False):
+    """Read the cursor pagination arguments from the current request.
+
+    When ``optional`` is set and the request asks for no cursor at all
+    None is returned, so callers can fall back to page based pagination.
+    Otherwise a missing cursor selects the first page.
+    """
+    cursor_given = 'after' in request.args or 'before' in request.args
+    if optional and not cursor_given:
+        return None
+
+    per_page = request.args.get('per_page', per_page, int)
+
+    return {
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'per_page': max(1, min(per_page, max_per_page))
+    }
+
+
+def page_version(query, created_at, _id, per_page, max_per_page,
+                 optional=False):
+    """Return the rows of the page the current request asks for.
+
+    ``query`` should only select what tells whether a listing changed
+    (keys and modification times), it's paginated the same way the
+    listing is. Page based pagination also counts the rows, as the
+    total is part of the page.
+    """
+    cursor = cursor_args(per_page, max_per_page, optional)
+    if cursor is not None:
+        page = query.cursor_paginate(created_at, _id, **cursor)
+        return [tuple(row) for row in page.items], page.has_next
+
+    page = max(request.args.get('page', 1, int), 1)
+    rows = query. \
+        order_by(created_at.desc()). \
+        limit(per_page). \
+        offset((page - 1) * per_page). \
+        all()
+    return [tuple(row) for row in rows], query.order_by(None).count()
+
+
+class CursorPagination(object):
+    """Keyset counterpart of Flask-SQLAlchemy's Pagination object.
+
+    Items are always sorted newest first by (created_at, id), and the
+    next/prev cursors point past the last/first item of the page.
+    """
+
+    def __init__(self, items, per_page, has_next, has_prev):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next and bool(items)
+        self.has_prev = has_prev and bool(items)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.items[-1]
+        return encode_cursor(last.created_at, last.id)
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev:
+            return None
+        first = self.items[0]
+        return encode_cursor(first.created_at, first.id)
+
+
+class PaginatedQuery(BaseQuery):
+
+    def cursor_paginate(
+        self,
+        created_at,
+        _id,
+        after=None,
+        before=None,
+        per_page=20
+    ):
+        """Returns ``per_page`` items after or before the given cursor.
+
+        Unlike ``paginate`` it neither counts the rows nor skips them with
+        an OFFSET, the cursor is resolved with a row value comparison so
+        every page costs the same index range scan.
+        """
+        key = tuple_(created_at, _id)
+        query = self.order_by(None)
+
+        before = decode_cursor(before)
+        after = decode_cursor(after)
+
+        if before is not None:
+            # Walk backwards from the cursor and flip the page afterwards
+            items = query. \
+                filter(key > tuple_(*before)). \
+                order_by(created_at.asc(), _id.asc()). \
+                limit(per_page + 1).all()
+            has_prev = len(items) > per_page
+            items = items[:per_page][::-1]
+
+            return CursorPagination(items, per_page, True, has_prev)
+
+        if after is not None:
+            query = query.filter(key < tuple_(*after))
+
+        items = query. \
+            order_by(created_at.desc(), _id.desc()). \
+            limit(per_page + 1).all()
+        has_next = len(items) > per_page
+
+        return CursorPagination(
+            items[:per_page], per_page, has_next, after is not None
+        )
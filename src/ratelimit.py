@@ -0,0 +1,177 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+from flask import request, current_app, has_app_context
+from flask_jwt_extended import get_jwt_identity
+
+
+def take(tokens, updated_at, now, limit, period, cost=1):
+    """Refill a bucket last left with ``tokens`` at ``updated_at`` and take
+    ``cost`` tokens out of it. Returns whether they could be taken along
+    with the tokens left."""
+    rate = limit / period
+    tokens = min(limit, tokens + max(now - updated_at, 0) * rate)
+    if tokens < cost:
+        return False, tokens
+    return True, tokens - cost
+
+
+class MemoryStore(object):
+    """In-process token buckets, split in stripes with a lock each.
+
+    Requests for different clients rarely wait on the same lock. Every
+    stripe keeps at most its share of ``max_buckets``, dropping the least
+    recently used bucket first, which only refills it early.
+    """
+
+    def __init__(self, stripes=16, max_buckets=65536):
+        self._stripes = [
+            (threading.Lock(), OrderedDict()) for _ in range(stripes)
+        ]
+        self.max_stripe_buckets = max(1, max_buckets // stripes)
+
+    def take(self, key, limit, period, cost=1):
+        lock, buckets = self._stripes[hash(key) % len(self._stripes)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated_at = buckets.pop(key, (limit, now))
+            allowed, tokens = take(
+                tokens, updated_at, now, limit, period, cost
+            )
+            buckets[key] = (tokens, now)
+            if len(buckets) > self.max_stripe_buckets:
+                buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SharedStore(object):
+    """Token buckets shared by every process, on top of a redis-like client.
+
+    A bucket is refilled and taken from in a single script, so concurrent
+    requests can't both take the last token. Only ``eval`` is used.
+    """
+
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or limit
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(
+    limit, tokens + math.max(now - updated_at, 0) * limit / period
+)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(period))
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix='rate-limit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, limit, period, cost=1):
+        # Buckets are full again after a period, so they expire then
+        allowed, tokens = self.client.eval(
+            self.SCRIPT, 1, self.prefix + key,
+            limit, period, cost, time.time()
+        )
+        return bool(allowed), float(tokens)
+
+
+class RateLimit(object):
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after')
+
+    def __init__(self, allowed, tokens, limit, period, cost=1):
+        rate = limit / period
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = math.floor(tokens)
+        # Seconds until the bucket is full, and until the request fits
+        self.reset = math.ceil((limit - tokens) / rate)
+        self.retry_after = 0 if allowed else \
+            max(1, math.ceil((cost - tokens) / rate))
+
+    def headers(self):
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset)
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+class RateLimiter(object):
+    """Limits how often each client calls a resource, with token buckets.
+
+    Resources name a scope and a default limit of ``limit`` requests per
+    ``period`` seconds, which RATELIMITS can override by scope. Clients
+    are told apart by the identity of their token, or else their address.
+    Behind reverse proxies, set TRUSTED_PROXIES to their number so the
+    address is the client's rather than the proxy's.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, store=None):
+        app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        app.config.setdefault('RATELIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATELIMITS', {})
+
+        if store is None:
+            store = self._create_store(app.config)
+
+        app.extensions['rate_limiter'] = store
+
+    @staticmethod
+    def _create_store(config):
+        kind = config['RATELIMIT_STORAGE']
+        if kind == 'memory':
+            return MemoryStore()
+        if kind == 'shared':
+            # Only needed for the shared store
+            import redis
+
+            return SharedStore(
+                redis.Redis.from_url(config['RATELIMIT_STORAGE_URL'])
+            )
+        return None
+
+    @property
+    def _store(self):
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('rate_limiter')
+
+    @staticmethod
+    def client_key():
+        identity = get_jwt_identity()
+        if identity is not None:
+            return f'user:{identity}'
+        return f'ip:{request.remote_addr}'
+
+    def hit(self, scope, limit, period, cost=1):
+        """Take from the current client's bucket for ``scope``, returns
+        the resulting RateLimit or None when rate limiting is off."""
+        store = self._store
+        if store is None:
+            return None
+        limit, period = current_app.config['RATELIMITS'].get(
+            scope, (limit, period)
+        )
+
+        allowed, tokens = store.take(
+            f'{scope}:{self.client_key()}', limit, period, cost
+        )
+        return RateLimit(allowed, tokens, limit, period, cost)
@@ -0,0 +1,110 @@
+from src.models import Post, User
+
+
+class AuthorRecord(object):
+    __slots__ = ('id', 'name', 'username', 'bio', 'email', 'avatar')
+
+    picture = User.picture
+
+
+class PostRecord(object):
+    """Read only stand-in for a Post in listings.
+
+    Records are filled straight from the selected columns, so listing a page
+    skips the identity map, attribute instrumentation and relationship
+    loaders of full Post objects. Columns that weren't selected are left
+    unset and get skipped when dumping, just like excluded fields.
+    """
+    __slots__ = (
+        'id',
+        'title',
+        'description',
+        'contents',
+        'tags',
+        'created_at',
+        'modified_at',
+        'favorites_count',
+        'comments_count',
+        'is_favorited',
+        'headline',
+        'author'
+    )
+
+    COLUMNS = (
+        'id',
+        'title',
+        'description',
+        'contents',
+        'tags',
+        'created_at',
+        'modified_at',
+        'favorites_count',
+        'comments_count'
+    )
+    # id and created_at are the pagination key
+    REQUIRED = ('id', 'created_at')
+    AUTHOR_PREFIX = 'author_'
+
+    def __init__(self):
+        self.is_favorited = False
+
+    @classmethod
+    def columns(cls, excluded=()):
+        # Labelled columns for Post.query.with_entities, the author ones
+        # require the query to be joined to users
+        columns = [
+            getattr(Post, name).label(name)
+            for name in cls.COLUMNS
+            if name in cls.REQUIRED or name not in excluded
+        ]
+        if 'author' not in excluded:
+            columns += [
+                getattr(User, name).label(cls.AUTHOR_PREFIX + name)
+                for name in AuthorRecord.__slots__
+            ]
+
+        return columns
+
+    @staticmethod
+    def version_columns():
+        # What changes when a listed post changes: edits and favorites
+        # bump modified_at, comments only the count, the author may too
+        return [
+            Post.id,
+            Post.created_at,
+            Post.modified_at,
+            Post.comments_count,
+            User.modified_at.label('author_modified_at')
+        ]
+
+    @classmethod
+    def from_rows(cls, rows):
+        if not rows:
+            return []
+
+        # Work out once where each value of a row goes
+        post_keys, author_keys = [], []
+        for i, key in enumerate(rows[0].keys()):
+            if key.startswith(cls.AUTHOR_PREFIX):
+                author_keys.append((i, key[len(cls.AUTHOR_PREFIX):]))
+            else:
+                post_keys.append((i, key))
+
+        records = []
+        for row in rows:
+            post = cls()
+            for i, key in post_keys:
+                setattr(post, key, row[i])
+            if author_keys:
+                author = post.author = AuthorRecord()
+                for i, key in author_keys:
+                    setattr(author, key, row[i])
+            records.append(post)
+
+        return records
+
+    @classmethod
+    def paginated(cls, pagination):
+        # Swap the rows of a page (either kind) for records
+        pagination.items = cls.from_rows(pagination.items)
+        return pagination
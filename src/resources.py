@@ -1,23 +1,45 @@
+import os
 from flask import request as req, current_app
 from flask_restful import Resource
-from flask_jwt_extended import create_access_token, current_user, jwt_required
-from sqlalchemy import select, func
-from src.models import User, Post, Comment
-from src.extensions import db
+from flask_jwt_extended import create_access_token, create_refresh_token, \
+    current_user, jwt_required, jwt_refresh_token_required, get_raw_jwt, \
+    decode_token
+from jwt import InvalidTokenError
+from src.models import User, Post, Comment, TagCount, favorites_assoc
+from src.extensions import db, revocation_store
+from src.records import PostRecord
 from src.exceptions import InvalidUsage
 from src.utils import save_file, delete_file
+from src.pagination import cursor_args, page_version
 from src.schemas import login_schema, user_schema, UserSchema, \
-    post_schema, posts_schema,\
+    post_schema, PostSchema, \
     comment_schema, comments_schema
 from src.middlewares import validate_with_schema, \
-    marshal_with_schema, dynamic_marshal_with_schema, valid_jwt_optional
+    marshal_with_schema, dynamic_marshal_with_schema, valid_jwt_optional, \
+    cached, conditional, rate_limit
+
+
+def post_cache_tags(post_id):
+    # Their authors' tags are picked up from the response
+    return [f'post:{post_id}']
+
+
+def user_version(username):
+    with_posts = 'posts' in req.args.getlist('include')
+    return User.get_version(username, with_posts)
 
 
 class UserResource(Resource):
 
-    @dynamic_marshal_with_schema(UserSchema, default_excluded=['posts'])
-    def get(self, username):
-        user = User.get_by_username(username)
+    @conditional(user_version, cached=True)
+    @dynamic_marshal_with_schema(
+        UserSchema,
+        default_excluded=['posts'],
+        model=User,
+        cache_tags=lambda username: [f'user:{username}']
+    )
+    def get(self, username, options):
+        user = User.get_by_username(username, options)
         if not user:
             raise InvalidUsage(404, 'User not found')
         return user
@@ -25,6 +47,7 @@ class UserResource(Resource):
 
 class UserRegister(Resource):
 
+    @rate_limit('register', limit=5, period=3600)
     @validate_with_schema(user_schema)
     def post(self, data):
         user_in_db = User.get_by_email(data['email'])
@@ -35,12 +58,18 @@ class UserRegister(Resource):
         user.save()
 
         token = create_access_token(identity=user)
+        refresh_token = create_refresh_token(identity=user)
 
-        return {'token': token, 'username': user.username}, 201
+        return {
+            'token': token,
+            'refresh_token': refresh_token,
+            'username': user.username
+        }, 201
 
 
 class UserLogin(Resource):
 
+    @rate_limit('login', limit=10, period=60)
     @validate_with_schema(login_schema)
     @marshal_with_schema(user_schema)
     def post(self, data):
@@ -51,9 +80,49 @@ class UserLogin(Resource):
 
         token = create_access_token(identity=user)
         user.token = token
+        user.refresh_token = create_refresh_token(identity=user)
         return user
 
 
+class TokenRefresh(Resource):
+
+    @jwt_refresh_token_required
+    def post(self):
+        # Built from the refresh token's own identity and claims, the user
+        # row isn't needed. The refresh token is rotated, it can't be
+        # used again once exchanged
+        tokens = {
+            'token': create_access_token(identity=current_user),
+            'refresh_token': create_refresh_token(identity=current_user)
+        }
+        revocation_store.revoke(get_raw_jwt())
+
+        return tokens
+
+
+class UserLogout(Resource):
+
+    @jwt_required
+    def post(self):
+        # Revoke the access token, and the refresh token if one is given
+        tokens = [get_raw_jwt()]
+        refresh_token = (req.get_json(silent=True) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                token = decode_token(refresh_token)
+            except InvalidTokenError:
+                raise InvalidUsage(422, 'Invalid refresh token')
+            identity = token.get(current_app.config['JWT_IDENTITY_CLAIM'])
+            if token['type'] != 'refresh' or identity != current_user.id:
+                raise InvalidUsage(422, 'Invalid refresh token')
+            tokens.append(token)
+
+        for token in tokens:
+            revocation_store.revoke(token)
+
+        return {'message': 'Logged out'}
+
+
 class UserMe(Resource):
 
     @jwt_required
@@ -61,104 +130,252 @@ class UserMe(Resource):
     @marshal_with_schema(user_schema)
     def put(self, data):
         UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
-        user = current_user
+        user = current_user.get_user()
+        old_avatar = user.avatar
 
         if 'picture' in req.files:
             file = req.files['picture']
-            filename = save_file(file, UPLOADS_FOLDER)
+            filename = save_file(
+                file,
+                UPLOADS_FOLDER,
+                max_size=current_app.config['AVATAR_MAX_SIZE']
+            )
             data['avatar'] = filename
-
-            if user.avatar:
-                delete_file(UPLOADS_FOLDER, user.avatar)
+            if filename:
+                # Held until the update is committed. Another user may have
+                # dropped the same picture, and deleted it, before that
+                User.lock_avatar(filename)
+                if not os.path.exists(os.path.join(UPLOADS_FOLDER, filename)):
+                    file.stream.seek(0)
+                    save_file(
+                        file,
+                        UPLOADS_FOLDER,
+                        max_size=current_app.config['AVATAR_MAX_SIZE']
+                    )
 
         user.update(**data)
 
+        # Pictures are named after their contents, so the old one may be
+        # the new one or another user's
+        if old_avatar and old_avatar != user.avatar:
+            User.lock_avatar(old_avatar)
+            if not User.avatar_in_use(old_avatar):
+                delete_file(UPLOADS_FOLDER, old_avatar)
+            db.session.commit()
+
         return user
 
     @jwt_required
     @dynamic_marshal_with_schema(UserSchema, default_excluded=['posts'])
     def get(self):
-        return current_user
+        return current_user.get_user()
 
 
 class TagResource(Resource):
+    @cached(cache_tags=['tags'])
     def get(self):
-        sub = db.session.query(
-            func.unnest(Post.tags).label('tag')
-        ).subquery()
-
-        q = select([
-            sub.c.tag,
-            func.count(sub.c.tag)
-        ]).select_from(
-            sub
-        ).group_by(sub.c.tag).order_by(
-            func.count(sub.c.tag).desc(),
-            sub.c.tag
-        )
-
-        tags = db.session.execute(q)
+        # Every tag unless a limit is asked for, which is then clamped
+        MAX_TAGS = 100
+        limit = req.args.get('limit', None, int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_TAGS))
+        tags = TagCount.get_most_used(limit)
 
-        return [tag for tag, c in tags]
+        return [tag.tag for tag in tags]
 
 
 class PostsResource(Resource):
+    POSTS_PER_PAGE = 6
+    MAX_POSTS_PER_PAGE = 50
 
     @jwt_required
     @validate_with_schema(post_schema)
     @marshal_with_schema(post_schema, status_code=201)
     def post(self, data):
-        post = Post(**data, owner_id=current_user.id)
+        user = current_user.get_user()
+        post = Post(**data, owner_id=user.id)
         post.save()
 
         return post
 
     @valid_jwt_optional
-    @marshal_with_schema(posts_schema, paginate=True)
-    def get(self):
-        POSTS_PER_PAGE = 6
+    @conditional(lambda: PostsResource.version(), cached=True)
+    @dynamic_marshal_with_schema(
+        PostSchema,
+        default_excluded=['contents'],
+        paginate=True,
+        records=PostRecord,
+        cache_tags=['posts']
+    )
+    def get(self, columns):
+        posts = self.query(columns)
+
+        cursor = cursor_args(
+            self.POSTS_PER_PAGE, self.MAX_POSTS_PER_PAGE, optional=True
+        )
+        if cursor is not None:
+            return PostRecord.paginated(posts.cursor_paginate(
+                Post.created_at, Post.id, **cursor
+            ))
+
         page = req.args.get('page', 1, int)
-        posts = Post.query. \
+        posts = posts. \
             order_by(Post.created_at.desc()). \
+            paginate(page, self.POSTS_PER_PAGE, False)
+
+        return PostRecord.paginated(posts)
+
+    @staticmethod
+    def query(columns):
+        posts = Post.query. \
+            with_entities(*columns). \
+            join(User, User.id == Post.owner_id)
+
+        # ?tag=a&tag=b lists posts tagged with both, unless ?match=any
+        tags = req.args.getlist('tag')
+        if tags:
+            match_any = req.args.get('match') == 'any'
+            posts = posts.filter(Post.tagged_with(tags, match_any))
+
+        return posts
+
+    @classmethod
+    def version(cls):
+        return page_version(
+            cls.query(PostRecord.version_columns()),
+            Post.created_at,
+            Post.id,
+            cls.POSTS_PER_PAGE,
+            cls.MAX_POSTS_PER_PAGE,
+            optional=True
+        )
+
+
+class PostSearchResource(Resource):
+
+    @valid_jwt_optional
+    @dynamic_marshal_with_schema(
+        PostSchema,
+        default_excluded=['contents'],
+        paginate=True,
+        model=Post
+    )
+    def get(self, options):
+        POSTS_PER_PAGE = 6
+        terms = req.args.get('q', '').strip()
+        if not terms:
+            raise InvalidUsage(400, 'Missing search query')
+
+        page = req.args.get('page', 1, int)
+        posts = Post.search(terms). \
+            options(*options). \
             paginate(page, POSTS_PER_PAGE, False)
 
+        # Attach the matching snippet to each post of the page
+        for post, headline in posts.items:
+            post.headline = headline
+        posts.items = [post for post, _ in posts.items]
+
         return posts
 
 
 class PostsByUserResource(Resource):
+    POSTS_PER_PAGE = 10
+    MAX_POSTS_PER_PAGE = 50
 
     @valid_jwt_optional
-    @marshal_with_schema(posts_schema)
-    def get(self, username):
+    @conditional(lambda username: PostsByUserResource.version(username))
+    @dynamic_marshal_with_schema(
+        PostSchema,
+        default_excluded=['contents'],
+        paginate=True,
+        records=PostRecord
+    )
+    def get(self, username, columns):
         user = User.get_by_username(username)
         if not user:
             raise InvalidUsage(404, 'User not found')
 
-        posts = user.posts. \
-            order_by(Post.created_at.desc()). \
-            filter_by(owner_id=user.id)
+        posts = self.query(columns, user.id).cursor_paginate(
+            Post.created_at,
+            Post.id,
+            **cursor_args(self.POSTS_PER_PAGE, self.MAX_POSTS_PER_PAGE)
+        )
 
-        return posts
+        return PostRecord.paginated(posts)
+
+    @staticmethod
+    def query(columns, user_id):
+        return Post.query. \
+            with_entities(*columns). \
+            join(User, User.id == Post.owner_id). \
+            filter(Post.owner_id == user_id)
+
+    @classmethod
+    def version(cls, username):
+        return page_version(
+            cls.query(
+                PostRecord.version_columns(), User.id_of(username)
+            ),
+            Post.created_at,
+            Post.id,
+            cls.POSTS_PER_PAGE,
+            cls.MAX_POSTS_PER_PAGE
+        )
 
 
 class FavoritePostsByUserResource(Resource):
+    POSTS_PER_PAGE = 10
+    MAX_POSTS_PER_PAGE = 50
 
     @valid_jwt_optional
-    @marshal_with_schema(posts_schema)
-    def get(self, username):
+    @conditional(
+        lambda username: FavoritePostsByUserResource.version(username)
+    )
+    @dynamic_marshal_with_schema(
+        PostSchema,
+        default_excluded=['contents'],
+        paginate=True,
+        records=PostRecord
+    )
+    def get(self, username, columns):
         user = User.get_by_username(username)
         if not user:
             raise InvalidUsage(404, 'User not found')
 
-        posts = user.favorites. \
-            order_by(Post.created_at.desc())
+        posts = self.query(columns, user.id).cursor_paginate(
+            Post.created_at,
+            Post.id,
+            **cursor_args(self.POSTS_PER_PAGE, self.MAX_POSTS_PER_PAGE)
+        )
 
-        return posts
+        return PostRecord.paginated(posts)
+
+    @staticmethod
+    def query(columns, user_id):
+        return Post.query. \
+            with_entities(*columns). \
+            join(User, User.id == Post.owner_id). \
+            join(favorites_assoc, favorites_assoc.c.post_id == Post.id). \
+            filter(favorites_assoc.c.user_id == user_id)
+
+    @classmethod
+    def version(cls, username):
+        return page_version(
+            cls.query(
+                PostRecord.version_columns(), User.id_of(username)
+            ),
+            Post.created_at,
+            Post.id,
+            cls.POSTS_PER_PAGE,
+            cls.MAX_POSTS_PER_PAGE
+        )
 
 
 class PostResource(Resource):
     @valid_jwt_optional
-    @marshal_with_schema(post_schema)
+    @conditional(Post.get_version, cached=True)
+    @marshal_with_schema(post_schema, cache_tags=post_cache_tags)
     def get(self, post_id):
         post = Post.get_one(post_id)
         if not post:
@@ -201,48 +418,83 @@ class FavoriteResource(Resource):
     @jwt_required
     @marshal_with_schema(post_schema)
     def post(self, post_id):
+        user = current_user.get_user()
         post = Post.get_one(post_id)
         if not post:
             raise InvalidUsage(404, 'Post not found')
-        post.favorite(current_user)
+        post.favorite(user)
 
         return post
 
     @jwt_required
     @marshal_with_schema(post_schema)
     def delete(self, post_id):
+        user = current_user.get_user()
         post = Post.get_one(post_id)
         if not post:
             raise InvalidUsage(404, 'Post not found')
-        post.unfavorite(current_user)
+        post.unfavorite(user)
 
         return post
 
 
 class CommentsResource(Resource):
+    COMMENTS_PER_PAGE = 20
+    MAX_COMMENTS_PER_PAGE = 100
 
     @jwt_required
+    @rate_limit('comment', limit=20, period=60)
     @validate_with_schema(comment_schema)
     @marshal_with_schema(comment_schema, status_code=201)
     def post(self, post_id, data):
         post = Post.get_one(post_id)
         if not post:
             raise InvalidUsage(404, 'Post not found')
-        comment = Comment(post_id=post.id, author_id=current_user.id, **data)
+        user = current_user.get_user()
+        comment = Comment(post_id=post.id, author_id=user.id, **data)
         comment.save()
 
         return comment
 
-    @marshal_with_schema(comments_schema)
+    @conditional(
+        lambda post_id: CommentsResource.version(post_id), cached=True
+    )
+    @marshal_with_schema(
+        comments_schema,
+        paginate=True,
+        cache_tags=post_cache_tags
+    )
     def get(self, post_id):
         post = Post.get_one(post_id)
         if not post:
             raise InvalidUsage(404, 'Post not found')
-        comments = post.comments. \
-            order_by(Comment.created_at.desc())
+        comments = post.comments.cursor_paginate(
+            Comment.created_at,
+            Comment.id,
+            **cursor_args(self.COMMENTS_PER_PAGE, self.MAX_COMMENTS_PER_PAGE)
+        )
 
         return comments
 
+    @classmethod
+    def version(cls, post_id):
+        return page_version(
+            Comment.query.join(
+                User, User.id == Comment.author_id
+            ).filter(
+                Comment.post_id == post_id
+            ).with_entities(
+                Comment.id,
+                Comment.created_at,
+                Comment.modified_at,
+                User.modified_at
+            ),
+            Comment.created_at,
+            Comment.id,
+            cls.COMMENTS_PER_PAGE,
+            cls.MAX_COMMENTS_PER_PAGE
+        )
+
 
 class CommentResource(Resource):
 
@@ -0,0 +1,165 @@
+import math
+import time
+import hashlib
+import threading
+import datetime as dt
+from flask import current_app, has_app_context
+from src.cache import TTLCache
+
+
+class BloomFilter(object):
+    """Set membership with false positives but never false negatives."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        # Items added, repeated ones included
+        self.count = 0
+        self.size = max(8, int(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing, two 64 bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        self.count += 1
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class _RevocationState(object):
+
+    def __init__(self, config):
+        self.capacity = config['JWT_REVOCATION_CAPACITY']
+        self.refresh_interval = config['JWT_REVOCATION_REFRESH']
+        self.rebuild_interval = config['JWT_REVOCATION_REBUILD']
+        self.filter = BloomFilter(self.capacity)
+        # Outcome of the database checks made for filter hits
+        self.checked = TTLCache(
+            max_entries=config['JWT_REVOCATION_CONFIRMED'],
+            ttl=self.rebuild_interval
+        )
+        self.lock = threading.Lock()
+        # Database time of the last refresh, None until the first one
+        self.since = None
+        self.refreshed_at = 0.0
+        self.rebuilt_at = 0.0
+        self.lookups = 0
+
+
+class RevocationStore(object):
+    """Answers whether a token was revoked, mostly without any I/O.
+
+    Revoked jtis are stored in the database and mirrored in a per process
+    bloom filter, so tokens that were never revoked (nearly all of them)
+    are cleared from memory. Only filter hits are checked against the
+    database, and the outcome is kept in an LRU, false positives until
+    their token expires. Every
+    JWT_REVOCATION_REFRESH seconds the filter picks up the revocations
+    made by other processes, and every JWT_REVOCATION_REBUILD seconds it's
+    rebuilt from scratch to forget expired tokens, whose rows are deleted
+    then. A rebuild also grows the filter past JWT_REVOCATION_CAPACITY
+    when there are more revoked tokens, and is brought forward once the
+    filter holds more than it was sized for.
+    """
+
+    # Revocations committed late still show up in the next refresh
+    REFRESH_OVERLAP = dt.timedelta(seconds=60)
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JWT_REVOCATION_CAPACITY', 100000)
+        app.config.setdefault('JWT_REVOCATION_CONFIRMED', 10000)
+        app.config.setdefault('JWT_REVOCATION_REFRESH', 10)
+        app.config.setdefault('JWT_REVOCATION_REBUILD', 3600)
+        app.extensions['revocation_store'] = _RevocationState(app.config)
+
+    @property
+    def _state(self):
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('revocation_store')
+
+    def _refresh(self, state):
+        # Local import, models depend on the extensions module
+        from src.models import RevokedToken
+
+        now = time.monotonic()
+        if now - state.refreshed_at < state.refresh_interval:
+            return
+        with state.lock:
+            if now - state.refreshed_at < state.refresh_interval:
+                return
+            rebuild = now - state.rebuilt_at >= state.rebuild_interval or \
+                state.filter.count > state.filter.capacity
+            if rebuild:
+                RevokedToken.prune()
+                state.since = None
+                state.rebuilt_at = now
+
+            since = state.since
+            state.since = RevokedToken.database_now()
+            if since is not None:
+                since -= self.REFRESH_OVERLAP
+            jtis = RevokedToken.get_jtis(since)
+            if rebuild:
+                # Room to keep revoking until the next rebuild
+                state.filter = BloomFilter(max(state.capacity, 2 * len(jtis)))
+            for jti in jtis:
+                state.filter.add(jti)
+                # Revoked since it was found not to be
+                if state.checked.get(jti) is False:
+                    state.checked.delete(jti)
+            state.refreshed_at = now
+
+    def is_revoked(self, jti, expires=None):
+        """Whether the token ``jti`` was revoked, ``expires`` is the
+        timestamp it expires at."""
+        from src.models import RevokedToken
+
+        state = self._state
+        self._refresh(state)
+        if jti not in state.filter:
+            return False
+        revoked = state.checked.get(jti)
+        if revoked is not None:
+            return revoked
+
+        state.lookups += 1
+        revoked = RevokedToken.is_revoked(jti)
+        if revoked:
+            state.checked.set(jti, True)
+        elif expires is not None:
+            state.checked.set(jti, False, ttl=max(expires - time.time(), 0))
+        return revoked
+
+    def revoke(self, token):
+        """Revoke a decoded token, effective right away in this process."""
+        from src.models import RevokedToken
+
+        config = current_app.config
+        RevokedToken.revoke(
+            jti=token['jti'],
+            token_type=token['type'],
+            user_id=token.get(config['JWT_IDENTITY_CLAIM']),
+            expires_at=dt.datetime.utcfromtimestamp(token['exp'])
+        )
+
+        state = self._state
+        state.filter.add(token['jti'])
+        state.checked.set(token['jti'], True)
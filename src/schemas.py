@@ -1,3 +1,4 @@
+from functools import lru_cache
 from marshmallow import Schema, fields, post_dump
 
 
@@ -10,8 +11,11 @@ class PostSchema(Schema):
     created_at = fields.DateTime(dump_only=True)
     modified_at = fields.DateTime(dump_only=True)
     favorites_count = fields.Int(dump_only=True)
+    comments_count = fields.Int(dump_only=True)
     is_favorited = fields.Boolean(dump_only=True)
     tags = fields.List(fields.Str(), required=False)
+    # Only present on search results
+    headline = fields.Str(dump_only=True)
 
 
 class LoginSchema(Schema):
@@ -27,6 +31,7 @@ class UserSchema(Schema):
     email = fields.Email(required=True)
     password = fields.Str(required=True, load_only=True)
     token = fields.Str(dump_only=True)
+    refresh_token = fields.Str(dump_only=True)
     picture = fields.Str(dump_only=True)
     posts = fields.Nested(PostSchema(exclude=('author',)), many=True)
 
@@ -45,6 +50,9 @@ def get_pagination_schema(schema):
         next_num = fields.Int(dump_only=True)
         prev_num = fields.Int(dump_only=True)
         total = fields.Int(dump_only=True)
+        # Only present on cursor paginated results
+        next = fields.Str(dump_only=True, attribute='next_cursor')
+        prev = fields.Str(dump_only=True, attribute='prev_cursor')
         items = fields.Nested(schema, many=True)
 
         @post_dump
@@ -58,6 +66,33 @@ def get_pagination_schema(schema):
     return PaginationSchema()
 
 
+# Variants of the schemas kept built, see get_schema
+SCHEMA_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def get_schema(schema_cls, exclude=frozenset(), many=False, paginate=False):
+    # Schemas are costly to build (and pagination ones define a new class)
+    # but safe to share, so reuse them for every request asking for the
+    # same variant
+    schema = schema_cls(exclude=exclude, many=many)
+    if paginate:
+        return get_pagination_schema(schema)
+    return schema
+
+
+def schema_cache_stats():
+    info = get_schema.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0
+    }
+
+
 login_schema = LoginSchema()
 
 user_schema = UserSchema(exclude=('posts',))
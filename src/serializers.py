@@ -0,0 +1,139 @@
+from functools import lru_cache
+from marshmallow import fields, missing
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from marshmallow.utils import ensure_text_type
+from src.schemas import SCHEMA_CACHE_SIZE
+
+
+class CompiledSchema(object):
+    """Drop-in replacement for ``schema.dump`` built by compile_schema.
+
+    Each field is turned into a line of generated Python instead of going
+    through the generic field objects, which is most of marshmallow's
+    dumping time. The output is the same as the schema's own ``dump``.
+    """
+
+    def __init__(self, schema, dump_one, post_dump_hooks):
+        self.schema = schema
+        self.many = schema.many
+        self._dump_one = dump_one
+        self._post_dump_hooks = post_dump_hooks
+
+    def dump(self, obj, many=None):
+        many = self.many if many is None else bool(many)
+        if many:
+            obj = list(obj) if obj is not None else obj
+            sample = obj[0] if obj else None
+        else:
+            sample = obj
+
+        # Generated code only reads attributes, leave mappings to marshmallow
+        if hasattr(sample, '__getitem__'):
+            return self.schema.dump(obj, many=many)
+
+        if many and obj is not None:
+            result = [self._dump_one(item) for item in obj]
+            for hook in self._post_dump_hooks:
+                result = [hook(item, many=many) for item in result]
+        else:
+            result = self._dump_one(obj)
+            for hook in self._post_dump_hooks:
+                result = hook(result, many=many)
+
+        return result
+
+
+def _value_expr(field, attr_name, name, env):
+    """Return a Python expression serializing ``value`` with ``field``."""
+    field_type = type(field)
+
+    if field_type is fields.Integer and not field.as_string:
+        return 'None if value is None else int(value)'
+
+    if field_type in (fields.String, fields.Email):
+        return (
+            'None if value is None else '
+            '(value if value.__class__ is str else ensure_text_type(value))'
+        )
+
+    if field_type is fields.DateTime and field.format in (None, 'iso'):
+        return 'None if value is None else value.isoformat()'
+
+    if field_type is fields.Nested:
+        nested = compile_schema(field.schema)
+        if nested is not None:
+            env[name] = nested
+            many = bool(field.many)
+            return f'None if value is None else {name}.dump(value, {many})'
+
+    if field_type is fields.List and \
+            type(field.inner) in (fields.String, fields.Email):
+        return (
+            'None if value is None else '
+            '[each if each.__class__ is str else ensure_text_type(each) '
+            'for each in value]'
+        )
+
+    # Anything else keeps marshmallow's own formatting
+    env[name] = field._serialize
+    return f'{name}(value, {attr_name!r}, obj)'
+
+
+def compile_schema(schema):
+    """Compile ``schema`` into a CompiledSchema.
+
+    Returns None when the schema relies on something the compiler doesn't
+    reproduce (pre dump hooks, post dump hooks receiving the whole
+    collection or the original object, dotted attributes), so callers can
+    keep using marshmallow for it.
+    """
+    if schema._has_processors(PRE_DUMP) or schema._hooks[(POST_DUMP, True)]:
+        return None
+
+    post_dump_hooks = []
+    for attr_name in schema._hooks[(POST_DUMP, False)]:
+        hook = getattr(schema, attr_name)
+        if hook.__marshmallow_hook__[(POST_DUMP, False)].get('pass_original'):
+            return None
+        post_dump_hooks.append(hook)
+
+    env = {'missing': missing, 'ensure_text_type': ensure_text_type}
+    lines = ['def dump_one(obj):', '    ret = {}']
+    for i, (attr_name, field) in enumerate(schema.dump_fields.items()):
+        attr = field.attribute or attr_name
+        key = field.data_key if field.data_key is not None else attr_name
+        if '.' in attr:
+            return None
+
+        if not field._CHECK_ATTRIBUTE or field.default is not missing:
+            # Let the field resolve its own value (Method, Function, ...)
+            env[f'f{i}'] = field
+            env['get_attribute'] = schema.get_attribute
+            lines += [
+                f'    value = f{i}.serialize('
+                f'{attr_name!r}, obj, accessor=get_attribute)',
+                '    if value is not missing:',
+                f'        ret[{key!r}] = value',
+            ]
+            continue
+
+        lines += [
+            f'    value = getattr(obj, {attr!r}, missing)',
+            '    if value is not missing:',
+            f'        ret[{key!r}] = '
+            f'{_value_expr(field, attr_name, f"f{i}", env)}',
+        ]
+    lines.append('    return ret')
+
+    exec(compile('\n'.join(lines), f'<{type(schema).__name__}>', 'exec'), env)
+
+    return CompiledSchema(schema, env['dump_one'], post_dump_hooks)
+
+
+# Compiled schemas keep their schema alive, so they're bounded like the
+# get_schema cache most of them come from
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def get_serializer(schema):
+    """Return the compiled version of ``schema`` when it can be compiled,
+    or the schema itself otherwise. Both expose ``dump``."""
+    return compile_schema(schema) or schema
@@ -1,6 +1,7 @@
 from flask_testing import TestCase
 from flask_jwt_extended import create_access_token
 from src.app import create_app, db
+from src.extensions import user_cache
 
 
 class BaseTestCase(TestCase):
@@ -22,6 +23,7 @@ class BaseTestCase(TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        user_cache.clear()
 
 
 class AuthorizedTestCase(BaseTestCase):
@@ -0,0 +1,257 @@
+import time
+import unittest
+from sqlalchemy import event
+from src.app import db
+from src.tests.base import AuthorizedTestCase
+from src.models import User, Post, Comment
+from src.extensions import response_cache
+from src.cache import MemoryBackend, SharedBackend
+
+
+class LocalClient(object):
+    """Stands in for the redis client of the shared backend"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        value, expires_at = value
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex is not None else None
+        self.data[key] = (value, expires_at)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.set(key, str(value).encode('utf-8'))
+        return value
+
+
+class MemoryBackendTest(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+        backend.get('a')
+        backend.set('c', b'3', 60)
+
+        self.assertEqual(backend.get('a'), b'1')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), b'3')
+        self.assertEqual(backend.evictions, 1)
+
+    def test_evicted_by_size(self):
+        backend = MemoryBackend(max_bytes=10)
+        backend.set('a', b'12345', 60)
+        backend.set('b', b'123456', 60)
+        backend.set('c', b'12345678901', 60)
+
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get('b'), b'123456')
+        self.assertIsNone(backend.get('c'))
+
+    def test_expired(self):
+        backend = MemoryBackend()
+        backend.set('a', b'1', 0)
+
+        self.assertIsNone(backend.get('a'))
+
+    def test_versions_not_evicted(self):
+        backend = MemoryBackend(max_entries=1)
+        backend.incr('posts')
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+
+        self.assertEqual(backend.get_versions(['posts', 'tags']), [1, 0])
+
+
+class ResponseCacheTest(AuthorizedTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.init_app(self.app, backend=self.create_backend())
+        self.post = {
+            'title': 'Test post',
+            'description': 'Test description',
+            'contents': 'Test contents',
+            'tags': ['python']
+        }
+
+    def create_backend(self):
+        return MemoryBackend()
+
+    def test_posts_cached(self):
+        user = User(**self.user)
+        user.save()
+        Post(**self.post, owner_id=user.id).save()
+
+        first = self.client.get('/posts')
+        second = self.client.get('/posts')
+
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(response_cache.stats()['hits'], 1)
+        self.assertEqual(response_cache.stats()['misses'], 1)
+
+    def test_posts_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+        self.client.get('/posts')
+        self.client.get(f'/posts/{post.id}')
+
+        post.update(title='Updated')
+        res = self.client.get('/posts')
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.json['data'][0]['title'], 'Updated')
+
+        self.authorized_post(f'/posts/{post.id}/favorite', user)
+        res = self.client.get(f'/posts/{post.id}')
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.json['favorites_count'], 1)
+
+    def test_comments_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+        self.client.get(f'/posts/{post.id}/comments')
+
+        Comment(contents='Hi', post_id=post.id, author_id=user.id).save()
+        res = self.client.get(f'/posts/{post.id}/comments')
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(res.json['data']), 1)
+
+    def test_user_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        self.client.get(f'/@{user.username}')
+
+        user.update(bio='Updated')
+        res = self.client.get(f'/@{user.username}')
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.json['bio'], 'Updated')
+
+    def test_authors_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        other = User(
+            name='Other',
+            username='other',
+            email='other@mail.com',
+            password='secret'
+        )
+        other.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+        other_post = Post(**self.post, owner_id=other.id)
+        other_post.save()
+        Comment(contents='Hi', post_id=post.id, author_id=other.id).save()
+        for url in ('/posts', f'/posts/{post.id}', f'/posts/{other_post.id}',
+                    f'/posts/{post.id}/comments'):
+            self.client.get(url)
+
+        user.update(name='Updated')
+
+        # Only what shows the user is invalidated
+        res = self.client.get('/posts')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.json['data'][1]['author']['name'], 'Updated')
+        res = self.client.get(f'/posts/{post.id}')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client.get(f'/posts/{other_post.id}')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        res = self.client.get(f'/posts/{post.id}/comments')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        other.update(username='renamed')
+        res = self.client.get(f'/posts/{post.id}/comments')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(
+            res.json['data'][0]['author']['username'], 'renamed'
+        )
+
+    def test_renamed_user_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        self.client.get(f'/@{user.username}')
+
+        user.update(username='renamed')
+        res = self.client.get('/@tester')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_tags_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+        self.client.get('/tags')
+        self.assertEqual(self.client.get('/tags').headers['X-Cache'], 'HIT')
+
+        post.update(tags=['js'])
+        res = self.client.get('/tags')
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.json, ['js'])
+
+    def test_not_modified_without_queries(self):
+        user = User(**self.user)
+        user.save()
+        Post(**self.post, owner_id=user.id).save()
+        etag = self.client.get('/posts').headers['ETag']
+
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            res = self.client.get('/posts', headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(statements, [])
+
+    def test_authorized_not_cached(self):
+        user = User(**self.user)
+        user.save()
+
+        self.authorized_get('/posts', user)
+        res = self.authorized_get('/posts', user)
+
+        self.assertNotIn('X-Cache', res.headers)
+        self.assertEqual(response_cache.stats()['misses'], 0)
+
+    def test_errors_not_cached(self):
+        self.client.get('/posts/1')
+        res = self.client.get('/posts/1')
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(response_cache.stats()['hits'], 0)
+
+
+class SharedResponseCacheTest(ResponseCacheTest):
+    def create_backend(self):
+        return SharedBackend(LocalClient())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -45,7 +45,96 @@ class CommentTest(AuthorizedTestCase):
         res = self.client.get(f"/posts/{post.id}/comments")
 
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(len(res.json), COMMENTS_NUM)
+        self.assertEqual(len(res.json['data']), COMMENTS_NUM)
+        self.assertIsNone(res.json['meta']['next'])
+
+    def test_comments_retrieved_by_cursor(self):
+        COMMENTS_NUM = 5
+        COMMENTS_PER_PAGE = 3
+        user = User(**self.user)
+        user.save()
+        post = Post(owner_id=user.id, **self.post)
+        post.save()
+        comments = [
+            Comment(**self.comment, post_id=post.id, author_id=user.id)
+            for _ in range(COMMENTS_NUM)
+        ]
+        [comment.save() for comment in comments]
+        comments_ids = [comment.id for comment in reversed(comments)]
+
+        res = self.client.get(
+            f"/posts/{post.id}/comments?per_page={COMMENTS_PER_PAGE}"
+        )
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [comment['id'] for comment in data['data']],
+            comments_ids[:COMMENTS_PER_PAGE]
+        )
+
+        res = self.client.get(
+            f"/posts/{post.id}/comments?per_page={COMMENTS_PER_PAGE}"
+            f"&after={data['meta']['next']}"
+        )
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [comment['id'] for comment in data['data']],
+            comments_ids[COMMENTS_PER_PAGE:]
+        )
+        self.assertIsNone(data['meta']['next'])
+
+    def test_comments_counted(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(owner_id=user.id, **self.post)
+        post.save()
+
+        for _ in range(2):
+            self.authorized_post(
+                f"/posts/{post.id}/comments",
+                user,
+                json=self.comment,
+            )
+        comment_id = post.comments.first().id
+        self.authorized_put(
+            f"/posts/{post.id}/comments/{comment_id}",
+            user,
+            json={'contents': 'Edited'}
+        )
+
+        res = self.client.get('/posts')
+        self.assertEqual(res.json['data'][0]['comments_count'], 2)
+
+        self.authorized_delete(
+            f"/posts/{post.id}/comments/{comment_id}",
+            user
+        )
+
+        res = self.client.get(f"/posts/{post.id}")
+        self.assertEqual(res.json['comments_count'], 1)
+
+    def test_comments_not_modified(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(owner_id=user.id, **self.post)
+        post.save()
+        Comment(**self.comment, post_id=post.id, author_id=user.id).save()
+
+        etag = self.client.get(f"/posts/{post.id}/comments").headers['ETag']
+        res = self.client.get(
+            f"/posts/{post.id}/comments", headers={'If-None-Match': etag}
+        )
+        self.assertEqual(res.status_code, 304)
+
+        user.update(name='Renamed')
+        res = self.client.get(
+            f"/posts/{post.id}/comments", headers={'If-None-Match': etag}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['data'][0]['author']['name'], 'Renamed')
 
     def test_comments_from_post_not_found(self):
         res = self.client.get('/posts/1/comments')
@@ -0,0 +1,45 @@
+import unittest
+from src.tests.base import BaseTestCase
+from src.models import Post, User
+from src.explain import index_report, sample_urls
+
+
+class ExplainTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(**self.user)
+        user.save()
+        post = Post(
+            title='Test post',
+            description='Test description',
+            contents='Test contents',
+            tags=['python'],
+            owner_id=user.id
+        )
+        post.save()
+
+    def test_sample_urls(self):
+        urls = sample_urls()
+
+        self.assertIn('/posts', urls)
+        self.assertIn(f"/@{self.user['username']}/favorites", urls)
+
+    def test_listings_use_indexes(self):
+        report = index_report(self.app, [
+            '/posts',
+            f"/@{self.user['username']}/posts",
+        ])
+        scans = {
+            scan.get('Index Name')
+            for _, _, _, url_scans in report
+            for scan in url_scans
+        }
+
+        self.assertTrue(report)
+        self.assertTrue(all(uses_index for _, _, uses_index, _ in report))
+        self.assertIn('ix_posts_created_at_id', scans)
+        self.assertIn('ix_posts_owner_id_created_at_id', scans)
+
+
+if __name__ == '__main__':
+    unittest.main()
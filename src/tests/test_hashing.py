@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from flask import Flask
+from src.exceptions import InvalidUsage
+from src.hashing import PasswordHasher
+
+
+# Run in the worker processes, they die as a crashed worker would
+def _exit(*args):
+    os._exit(1)
+
+
+def _exit_once(path):
+    if not os.path.exists(path):
+        open(path, 'w').close()
+        os._exit(1)
+    return True, 0.0
+
+
+def create_hasher(**config):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_ROUNDS=4, **config)
+    return PasswordHasher(app)
+
+
+class PasswordHasherTest(unittest.TestCase):
+    def test_hashed_inline(self):
+        hasher = create_hasher(PASSWORD_HASH_WORKERS=0)
+
+        pw_hash = hasher.generate_password_hash('secret')
+
+        self.assertTrue(pw_hash.startswith('$2b$04$'))
+        self.assertTrue(hasher.check_password_hash(pw_hash, 'secret'))
+        self.assertFalse(hasher.check_password_hash(pw_hash, 'wrong'))
+        self.assertEqual(hasher.metrics.stats()['count'], 3)
+
+    def test_hashed_in_pool(self):
+        hasher = create_hasher(PASSWORD_HASH_WORKERS=1)
+        try:
+            pw_hash = hasher.generate_password_hash('secret')
+            matches = hasher.check_password_hash(pw_hash, 'secret')
+        finally:
+            hasher.shutdown()
+
+        stats = hasher.metrics.stats()
+        self.assertTrue(matches)
+        self.assertEqual(stats['count'], 2)
+        self.assertGreater(stats['hash_time_max'], 0)
+        self.assertGreaterEqual(stats['queue_wait_max'], 0)
+
+    def test_broken_pool_replaced(self):
+        hasher = create_hasher(PASSWORD_HASH_WORKERS=1)
+        with tempfile.TemporaryDirectory() as path:
+            try:
+                result = hasher._run(_exit_once, os.path.join(path, 'died'))
+                pw_hash = hasher.generate_password_hash('secret')
+            finally:
+                hasher.shutdown()
+
+        self.assertTrue(result)
+        self.assertTrue(pw_hash.startswith('$2b$04$'))
+
+    def test_broken_pool_rejected_after_retry(self):
+        hasher = create_hasher(PASSWORD_HASH_WORKERS=1)
+        try:
+            with self.assertRaises(InvalidUsage) as context:
+                hasher._run(_exit)
+            pw_hash = hasher.generate_password_hash('secret')
+        finally:
+            hasher.shutdown()
+
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertTrue(pw_hash.startswith('$2b$04$'))
+
+    def test_rejected_when_queue_full(self):
+        hasher = create_hasher(
+            PASSWORD_HASH_WORKERS=0,
+            PASSWORD_HASH_QUEUE=0
+        )
+        hasher._slots.acquire()
+
+        with self.assertRaises(InvalidUsage) as context:
+            hasher.generate_password_hash('secret')
+
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(hasher.metrics.stats()['rejected'], 1)
+
+    def test_empty_password(self):
+        hasher = create_hasher(PASSWORD_HASH_WORKERS=0)
+
+        with self.assertRaises(ValueError):
+            hasher.generate_password_hash('')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 from src.tests.base import AuthorizedTestCase
 from src.models import Post, User
 from datetime import datetime as dt
+from sqlalchemy import event
+from src.app import db
 
 
 class PostTest(AuthorizedTestCase):
@@ -92,6 +94,105 @@ class PostTest(AuthorizedTestCase):
             'favorites_count': [2, 1, 1] + [0]*3
         })
 
+    def test_posts_retrieved_without_contents(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+
+        res = self.client.get('/posts')
+
+        data = res.json['data']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data[0]['description'], self.post['description'])
+        self.assertNotIn('contents', data[0])
+
+        res = self.client.get(f'/@{user.username}/posts?include=contents')
+
+        data = res.json['data']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data[0]['contents'], self.post['contents'])
+
+    def test_posts_listed_as_records(self):
+        user = User(**self.user)
+        user.save()
+        post1 = Post(**self.post, owner_id=user.id)
+        post1.favorited_by = [user]
+        post1.save()
+        post2 = Post(**self.post, owner_id=user.id)
+        post2.save()
+
+        res = self.authorized_get('/posts?exclude=author', user)
+
+        data = res.json['data']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([post['id'] for post in data], [post2.id, post1.id])
+        self.assertEqual(
+            [post['is_favorited'] for post in data], [False, True]
+        )
+        self.assertEqual(data[1]['favorites_count'], 1)
+        self.assertEqual(data[1]['tags'], self.post['tags'])
+        self.assertNotIn('author', data[0])
+        self.assertNotIn('contents', data[0])
+
+        res = self.client.get('/posts')
+
+        author = res.json['data'][0]['author']
+        self.assertEqual(author['username'], user.username)
+        self.assertEqual(author['bio'], user.bio)
+        self.assertIsNone(author['picture'])
+        self.assertNotIn('posts', author)
+
+    def test_posts_retrieved_by_cursor(self):
+        POSTS_NUM = 11
+        POSTS_PER_PAGE = 6
+        user = User(**self.user)
+        user.save()
+
+        posts = [
+            Post(**self.post, owner_id=user.id, created_at=dt.now())
+            for _ in range(POSTS_NUM)
+        ]
+        [post.save() for post in posts]
+        posts_ids = [post.id for post in reversed(posts)]
+
+        res = self.client.get('/posts?after=')
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            posts_ids[:POSTS_PER_PAGE]
+        )
+        self.assertIsNone(data['meta']['prev'])
+        self.assertNotIn('total', data['meta'])
+
+        res = self.client.get(f"/posts?after={data['meta']['next']}")
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            posts_ids[POSTS_PER_PAGE:]
+        )
+        self.assertIsNone(data['meta']['next'])
+
+        res = self.client.get(f"/posts?before={data['meta']['prev']}")
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            posts_ids[:POSTS_PER_PAGE]
+        )
+        self.assertIsNone(data['meta']['prev'])
+
+    def test_posts_retrieved_by_invalid_cursor(self):
+        res = self.client.get('/posts?after=notacursor')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json['message'], 'Invalid cursor')
+
     def test_tagged_posts_retrieved(self):
         user = User(**self.user)
         user.save()
@@ -114,6 +215,81 @@ class PostTest(AuthorizedTestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(len(data['data']), 2)
 
+    def test_multi_tagged_posts_retrieved(self):
+        user = User(**self.user)
+        user.save()
+        post1 = Post(**self.post, owner_id=user.id)
+        post1.tags = ['aws']
+        post1.save()
+        post2 = Post(**self.post, owner_id=user.id)
+        post2.tags = ['aws', 'python']
+        post2.save()
+        post3 = Post(**self.post, owner_id=user.id)
+        post3.tags = ['python', 'ruby']
+        post3.save()
+        post4 = Post(**self.post, owner_id=user.id)
+        post4.tags = ['js']
+        post4.save()
+
+        res = self.client.get('/posts?tag=aws&tag=python&after=')
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([post['id'] for post in data['data']], [post2.id])
+        self.assertIsNone(data['meta']['next'])
+
+        res = self.client.get('/posts?tag=aws&tag=python&match=any&after=')
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            [post3.id, post2.id, post1.id]
+        )
+
+    def test_posts_searched(self):
+        user = User(**self.user)
+        user.save()
+        post1 = Post(
+            title='Flask tips',
+            description='Some notes about web frameworks',
+            contents='Nothing else',
+            owner_id=user.id
+        )
+        post1.save()
+        post2 = Post(
+            title='Cooking',
+            description='Pasta recipes',
+            contents='Boil water',
+            owner_id=user.id
+        )
+        post2.save()
+        post3 = Post(
+            title='Deploying',
+            description='Running a flask app behind nginx',
+            contents='Use gunicorn',
+            owner_id=user.id
+        )
+        post3.save()
+
+        res = self.client.get('/posts/search?q=flask')
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['meta']['total'], 2)
+        # Matches in the title rank higher than in the description
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            [post1.id, post3.id]
+        )
+        self.assertIn('<b>flask</b>', data['data'][1]['headline'])
+
+    def test_posts_searched_without_query(self):
+        res = self.client.get('/posts/search?q=')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json['message'], 'Missing search query')
+
     def test_posts_by_user_retrieved(self):
         user = User(**self.user)
         user.save()
@@ -131,7 +307,7 @@ class PostTest(AuthorizedTestCase):
 
         res = self.client.get(f'/@{user.username}/posts')
 
-        data = res.json
+        data = res.json['data']
         authors = [post['author']['id'] for post in data]
         posts_ids = [post['id'] for post in data]
 
@@ -160,7 +336,7 @@ class PostTest(AuthorizedTestCase):
 
         res = self.client.get(f'/@{user.username}/favorites')
 
-        data = res.json
+        data = res.json['data']
         authors = [post['author']['id'] for post in data]
         posts_ids = [post['id'] for post in data]
 
@@ -169,6 +345,145 @@ class PostTest(AuthorizedTestCase):
         self.assertEqual(authors, [user.id]*2)
         self.assertEqual(posts_ids, [post3.id, post1.id])
 
+    def test_posts_by_user_page_size_bounded(self):
+        MAX_POSTS_PER_PAGE = 50
+        user = User(**self.user)
+        user.save()
+
+        posts = [
+            Post(**self.post, owner_id=user.id, created_at=dt.now())
+            for _ in range(MAX_POSTS_PER_PAGE + 1)
+        ]
+        [post.save() for post in posts]
+
+        res = self.client.get(f'/@{user.username}/posts?per_page=1000')
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['data']), MAX_POSTS_PER_PAGE)
+        self.assertEqual(data['data'][0]['id'], posts[-1].id)
+        self.assertIsNotNone(data['meta']['next'])
+
+        res = self.client.get(
+            f"/@{user.username}/posts?after={data['meta']['next']}"
+        )
+
+        data = res.json
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['data']],
+            [posts[0].id]
+        )
+        self.assertIsNone(data['meta']['next'])
+
+    def test_posts_sorted_by_favorites_count(self):
+        user = User(**self.user)
+        user.save()
+        user2 = User('Another', 'another', 'another@mail.com', 'secret')
+        user2.save()
+
+        post1 = Post(**self.post, owner_id=user.id)
+        post1.favorited_by = [user]
+        post1.save()
+        post2 = Post(**self.post, owner_id=user.id)
+        post2.favorited_by = [user, user2]
+        post2.save()
+        post3 = Post(**self.post, owner_id=user.id)
+        post3.save()
+        post1.unfavorite(user)
+        post3.favorite(user2)
+
+        posts = Post.query. \
+            filter(Post.favorites_count > 0). \
+            order_by(Post.favorites_count.desc()). \
+            all()
+
+        self.assertEqual(posts, [post2, post3])
+        self.assertEqual(
+            [post.favorites_count for post in posts],
+            [2, 1]
+        )
+
+    def test_post_not_modified(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+
+        res = self.client.get(f'/posts/{post.id}')
+        etag = res.headers['ETag']
+
+        res = self.client.get(
+            f'/posts/{post.id}', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+
+        self.authorized_post(f'/posts/{post.id}/favorite', user)
+        res = self.client.get(
+            f'/posts/{post.id}', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_posts_not_modified(self):
+        user = User(**self.user)
+        user.save()
+        post1 = Post(**self.post, owner_id=user.id)
+        post1.save()
+        post2 = Post(**self.post, owner_id=user.id)
+        post2.save()
+
+        etag = self.client.get('/posts').headers['ETag']
+        res = self.client.get('/posts', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        # The ETag follows the body, which depends on who's asking
+        self.authorized_post(f'/posts/{post1.id}/favorite', user)
+        res = self.authorized_get(
+            '/posts', user, headers={'If-None-Match': etag}
+        )
+        self.assertEqual(res.status_code, 200)
+
+        post1.delete()
+        res = self.client.get('/posts', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json['data']), 1)
+
+    def test_not_modified_without_main_query(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+
+        for url in (f'/posts/{post.id}', '/posts', '/posts?after=',
+                    f'/@{user.username}/posts', f'/@{user.username}'):
+            etag = self.authorized_get(url, user).headers['ETag']
+
+            statements = []
+
+            def capture(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                res = self.authorized_get(
+                    url, user, headers={'If-None-Match': etag}
+                )
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+
+            self.assertEqual(res.status_code, 304)
+            # Neither the post's contents nor the user's profile are read,
+            # pages by number are counted as the total is part of them
+            self.assertEqual(
+                len(statements), 2 if url == '/posts' else 1
+            )
+            for statement in statements:
+                self.assertNotIn('posts.title', statement)
+                self.assertNotIn('users.bio', statement)
+
     def test_post_not_found(self):
         res = self.client.get(f"/posts/1")
 
@@ -255,6 +570,23 @@ class PostTest(AuthorizedTestCase):
         self.assertEqual(res.json['favorites_count'], 1)
         self.assertEqual(res.json['is_favorited'], True)
 
+    def test_post_favorited_twice(self):
+        user = User(**self.user)
+        user.save()
+
+        post = Post(**self.post, owner_id=user.id)
+        post.favorited_by = [user]
+        post.save()
+
+        res = self.authorized_post(
+            f"/posts/{post.id}/favorite",
+            user
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['favorites_count'], 1)
+        self.assertEqual(res.json['is_favorited'], True)
+
     def test_post_unfavorited(self):
         user = User(**self.user)
         user.save()
@@ -272,6 +604,22 @@ class PostTest(AuthorizedTestCase):
         self.assertEqual(res.json['favorites_count'], 0)
         self.assertEqual(res.json['is_favorited'], False)
 
+    def test_post_not_favorited_unfavorited(self):
+        user = User(**self.user)
+        user.save()
+
+        post = Post(**self.post, owner_id=user.id)
+        post.save()
+
+        res = self.authorized_delete(
+            f"/posts/{post.id}/favorite",
+            user
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['favorites_count'], 0)
+        self.assertEqual(res.json['is_favorited'], False)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import patch
+from src.tests.base import AuthorizedTestCase
+from src.models import User, Post
+from src.config import Testing
+from src.extensions import rate_limiter
+from src.ratelimit import MemoryStore, SharedStore, take
+
+
+class LocalClient(object):
+    """Stands in for the redis client of the shared store, running the
+    bucket script's logic in Python"""
+
+    def __init__(self):
+        self.data = {}
+
+    def eval(self, script, numkeys, key, limit, period, cost, now):
+        tokens, updated_at = self.data.get(key, (limit, now))
+        allowed, tokens = take(tokens, updated_at, now, limit, period, cost)
+        self.data[key] = (tokens, now)
+        return int(allowed), str(tokens).encode('utf-8')
+
+
+class MemoryStoreTest(unittest.TestCase):
+    def test_bucket_emptied(self):
+        store = MemoryStore()
+        results = [store.take('a', 3, 60)[0] for _ in range(4)]
+
+        self.assertEqual(results, [True, True, True, False])
+        self.assertTrue(store.take('b', 3, 60)[0])
+
+    def test_bucket_refilled(self):
+        allowed, tokens = take(0, 0, 30, limit=10, period=60)
+
+        self.assertTrue(allowed)
+        self.assertEqual(tokens, 4)
+        self.assertEqual(take(0, 0, 600, 10, 60), (True, 9))
+
+    def test_least_recently_used_dropped(self):
+        store = MemoryStore(stripes=1, max_buckets=2)
+        store.take('a', 1, 60)
+        store.take('b', 1, 60)
+        store.take('a', 1, 60)
+        store.take('c', 1, 60)
+
+        # a is still empty, b was dropped and comes back full
+        self.assertFalse(store.take('a', 1, 60)[0])
+        self.assertTrue(store.take('b', 1, 60)[0])
+
+
+class RateLimitTest(AuthorizedTestCase):
+    def setUp(self):
+        super().setUp()
+        rate_limiter.init_app(self.app, store=self.create_store())
+
+    def create_store(self):
+        return MemoryStore()
+
+    def login(self, password='secret'):
+        return self.client.post('/login', json={
+            'email': self.user['email'],
+            'password': password
+        })
+
+    def test_login_limited(self):
+        User(**self.user).save()
+
+        res = self.login()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-RateLimit-Limit'], '10')
+        self.assertEqual(res.headers['X-RateLimit-Remaining'], '9')
+        self.assertIn('X-RateLimit-Reset', res.headers)
+
+        for _ in range(9):
+            res = self.login(password='wrong')
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(res.headers['X-RateLimit-Remaining'], '0')
+
+        res = self.login()
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(
+            res.json['message'],
+            'Too many requests, try again later'
+        )
+        self.assertGreaterEqual(int(res.headers['Retry-After']), 1)
+
+    def test_limits_configured(self):
+        self.app.config['RATELIMITS'] = {'register': (1, 60)}
+        self.client.post('/register', json=self.user)
+
+        res = self.client.post('/register', json=self.user)
+        self.assertEqual(res.status_code, 429)
+
+    def test_comments_limited_by_user(self):
+        user = User(**self.user)
+        user.save()
+        other = User(
+            name='Other',
+            username='other',
+            email='other@mail.com',
+            password='secret'
+        )
+        other.save()
+        post = Post(
+            title='Test post',
+            description='Test description',
+            contents='Test contents',
+            owner_id=user.id
+        )
+        post.save()
+        self.app.config['RATELIMITS'] = {'comment': (1, 60)}
+        url = f'/posts/{post.id}/comments'
+
+        res = self.authorized_post(url, user, json={'contents': 'Hi'})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.headers['X-RateLimit-Remaining'], '0')
+        res = self.authorized_post(url, user, json={'contents': 'Hi'})
+        self.assertEqual(res.status_code, 429)
+
+        res = self.authorized_post(url, other, json={'contents': 'Hi'})
+        self.assertEqual(res.status_code, 201)
+
+
+class ProxiedRateLimitTest(AuthorizedTestCase):
+    def create_app(self):
+        with patch.object(Testing, 'TRUSTED_PROXIES', 1, create=True):
+            return super().create_app()
+
+    def test_clients_told_apart_behind_proxy(self):
+        self.app.config['RATELIMITS'] = {'login': (1, 60)}
+
+        def login(address):
+            return self.client.post(
+                '/login',
+                json={'email': 'tester@mail.com', 'password': 'secret'},
+                headers={'X-Forwarded-For': address}
+            )
+
+        self.assertEqual(login('10.0.0.1').status_code, 403)
+        self.assertEqual(login('10.0.0.1').status_code, 429)
+        self.assertEqual(login('10.0.0.2').status_code, 403)
+
+
+class SharedRateLimitTest(RateLimitTest):
+    def create_store(self):
+        return SharedStore(LocalClient())
+
+
+if __name__ == '__main__':
+    unittest.main()
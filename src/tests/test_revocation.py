@@ -0,0 +1,175 @@
+import uuid
+import unittest
+from sqlalchemy import event
+from src.tests.base import BaseTestCase
+from src.app import db
+from src.extensions import revocation_store
+from src.models import User, RevokedToken
+from src.revocation import BloomFilter
+from flask_jwt_extended import create_access_token, decode_token
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_members_found(self):
+        bloom = BloomFilter(1000)
+        members = [str(uuid.uuid4()) for _ in range(1000)]
+        for member in members:
+            bloom.add(member)
+
+        self.assertTrue(all(member in bloom for member in members))
+
+    def test_few_false_positives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for _ in range(1000):
+            bloom.add(str(uuid.uuid4()))
+
+        false_positives = sum(
+            str(uuid.uuid4()) in bloom for _ in range(10000)
+        )
+        self.assertLess(false_positives, 300)
+
+
+class RevocationStoreTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User(**self.user)
+        self.owner.save()
+
+    def create_token(self):
+        return decode_token(create_access_token(identity=self.owner))
+
+    def capture_statements(self, func):
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        return result, statements
+
+    def test_unrevoked_cleared_without_queries(self):
+        token = self.create_token()
+        revocation_store.is_revoked(token['jti'])
+
+        revoked, statements = self.capture_statements(
+            lambda: revocation_store.is_revoked(token['jti'])
+        )
+
+        self.assertFalse(revoked)
+        self.assertEqual(statements, [])
+
+    def test_revoked(self):
+        token = self.create_token()
+        revocation_store.is_revoked(token['jti'])
+
+        revocation_store.revoke(token)
+        revoked, statements = self.capture_statements(
+            lambda: revocation_store.is_revoked(token['jti'])
+        )
+
+        self.assertTrue(revoked)
+        self.assertEqual(statements, [])
+        self.assertTrue(RevokedToken.is_revoked(token['jti']))
+
+    def test_false_positive_checked_once(self):
+        token = self.create_token()
+        state = self.app.extensions['revocation_store']
+        revocation_store.is_revoked(token['jti'], token['exp'])
+        state.filter.add(token['jti'])
+
+        self.assertFalse(revocation_store.is_revoked(
+            token['jti'], token['exp']
+        ))
+        revoked, statements = self.capture_statements(
+            lambda: revocation_store.is_revoked(token['jti'], token['exp'])
+        )
+
+        self.assertFalse(revoked)
+        self.assertEqual(statements, [])
+        self.assertEqual(state.lookups, 1)
+
+        # Unless it's revoked afterwards, by any process
+        RevokedToken.revoke(
+            jti=token['jti'],
+            token_type='access',
+            user_id=self.owner.id,
+            expires_at=RevokedToken.database_now().replace(year=2100)
+        )
+        state.refreshed_at = 0.0
+        self.assertTrue(revocation_store.is_revoked(
+            token['jti'], token['exp']
+        ))
+
+    def test_revocations_of_other_processes_picked_up(self):
+        token = self.create_token()
+        self.assertFalse(revocation_store.is_revoked(token['jti']))
+
+        # Written by another process, seen once the filter is refreshed
+        RevokedToken.revoke(
+            jti=token['jti'],
+            token_type='access',
+            user_id=self.owner.id,
+            expires_at=RevokedToken.database_now().replace(year=2100)
+        )
+        self.app.extensions['revocation_store'].refreshed_at = 0.0
+
+        self.assertTrue(revocation_store.is_revoked(token['jti']))
+
+    def revoke_other(self, expires_at):
+        jti = str(uuid.uuid4())
+        RevokedToken.revoke(
+            jti=jti,
+            token_type='access',
+            user_id=self.owner.id,
+            expires_at=expires_at
+        )
+        return jti
+
+    def test_expired_pruned_on_rebuild(self):
+        now = RevokedToken.database_now()
+        expired = self.revoke_other(now.replace(year=2000))
+        unexpired = self.revoke_other(now.replace(year=2100))
+        state = self.app.extensions['revocation_store']
+        state.refreshed_at = state.rebuilt_at = 0.0
+
+        self.assertFalse(revocation_store.is_revoked(expired))
+
+        self.assertFalse(RevokedToken.is_revoked(expired))
+        self.assertTrue(RevokedToken.is_revoked(unexpired))
+        self.assertTrue(revocation_store.is_revoked(unexpired))
+
+    def test_filter_grown_on_rebuild(self):
+        expires_at = RevokedToken.database_now().replace(year=2100)
+        jtis = [self.revoke_other(expires_at) for _ in range(3)]
+        state = self.app.extensions['revocation_store']
+        state.capacity = 2
+        state.refreshed_at = state.rebuilt_at = 0.0
+
+        revocation_store.is_revoked(jtis[0])
+
+        self.assertEqual(state.filter.capacity, 6)
+        self.assertTrue(all(jti in state.filter for jti in jtis))
+
+    def test_rebuilt_once_full(self):
+        token = self.create_token()
+        revocation_store.is_revoked(token['jti'])
+        state = self.app.extensions['revocation_store']
+        rebuilt_at = state.rebuilt_at
+        full = state.filter = BloomFilter(1)
+
+        revocation_store.revoke(token)
+        revocation_store.revoke(self.create_token())
+        state.refreshed_at = 0.0
+        revocation_store.is_revoked(token['jti'])
+
+        self.assertGreater(state.rebuilt_at, rebuilt_at)
+        self.assertIsNot(state.filter, full)
+        self.assertIn(token['jti'], state.filter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from src.tests.base import BaseTestCase
+from flask_jwt_extended import create_access_token
+from src.models import User, Post, Comment
+from src.records import PostRecord
+from src.resources import PostsResource
+from src.schemas import UserSchema, PostSchema, get_schema, \
+    schema_cache_stats, post_schema, user_schema, comment_schema, \
+    comments_schema, get_pagination_schema, SCHEMA_CACHE_SIZE
+from src.serializers import compile_schema, get_serializer
+
+
+class SchemaCacheTest(BaseTestCase):
+    def test_schema_reused(self):
+        before = schema_cache_stats()
+
+        schema = get_schema(PostSchema, frozenset({'contents'}), True, True)
+        same = get_schema(PostSchema, frozenset({'contents'}), True, True)
+        other = get_schema(UserSchema, frozenset({'posts'}), True, True)
+
+        after = schema_cache_stats()
+        self.assertIs(schema, same)
+        self.assertIsNot(schema, other)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertGreater(after['hit_rate'], 0)
+
+    def test_paginated_schema_cached(self):
+        schema = get_schema(PostSchema, frozenset(), True, True)
+
+        self.assertEqual(set(schema.dump_fields), {
+            'page', 'pages', 'next_num', 'prev_num', 'total',
+            'next', 'prev', 'items'
+        })
+        self.assertTrue(schema.fields['items'].many)
+
+
+class CompiledSchemaTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User(**self.user)
+        self.author.save()
+        self.post = Post(
+            title='Title',
+            description='Description',
+            contents='Contents',
+            tags=['python', 'flask'],
+            owner_id=self.author.id
+        )
+        self.post.favorited_by = [self.author]
+        self.post.save()
+        self.untagged = Post(
+            title='Untagged',
+            description='Description',
+            contents='Contents',
+            owner_id=self.author.id
+        )
+        self.untagged.save()
+        self.comment = Comment(
+            contents='Comment',
+            post_id=self.post.id,
+            author_id=self.author.id
+        )
+        self.comment.save()
+
+    def assertSameDump(self, schema, obj):
+        compiled = compile_schema(schema)
+        self.assertIsNotNone(compiled)
+        self.assertEqual(compiled.dump(obj), schema.dump(obj))
+
+    def test_post_schema(self):
+        self.assertSameDump(post_schema, self.post)
+        self.assertSameDump(post_schema, self.untagged)
+
+    def test_posts_page(self):
+        page = Post.query.order_by(Post.id).paginate(1, 6, False)
+        Post.resolve_favorited(page.items, self.author)
+        schema = get_schema(PostSchema, frozenset({'contents'}), True, True)
+
+        self.assertSameDump(schema, page)
+        self.assertSameDump(schema, Post.query.paginate(2, 6, False))
+
+    def test_post_records_page(self):
+        for excluded in (set(), {'contents'}, {'author', 'tags'}):
+            columns = PostRecord.columns(excluded)
+            page = PostsResource.query(columns).order_by(Post.id). \
+                paginate(1, 6, False)
+            schema = get_schema(PostSchema, frozenset(excluded), True, True)
+
+            self.assertSameDump(schema, PostRecord.paginated(page))
+
+    def test_post_records_served_alike(self):
+        token = create_access_token(identity=self.author)
+        urls = [
+            '/posts',
+            '/posts?include=contents',
+            '/posts?exclude=author,tags',
+            '/posts?include=contents&exclude=description',
+            '/posts?after=&per_page=1'
+        ]
+        for url in urls:
+            for headers in ({}, {'Authorization': f'Bearer {token}'}):
+                dumped = []
+                for compiled in (True, False):
+                    self.app.config['COMPILE_SCHEMAS'] = compiled
+                    res = self.client.get(url, headers=headers)
+                    self.assertEqual(res.status_code, 200)
+                    dumped.append(res.json)
+
+                self.assertEqual(dumped[0], dumped[1], url)
+
+    def test_user_schema(self):
+        self.author.token = 'token'
+        self.assertSameDump(user_schema, self.author)
+        self.assertSameDump(UserSchema(), self.author)
+
+    def test_comment_schemas(self):
+        self.assertSameDump(comment_schema, self.comment)
+        self.assertSameDump(comments_schema, [self.comment])
+        self.assertSameDump(
+            get_pagination_schema(comments_schema),
+            self.post.comments.cursor_paginate(Comment.created_at, Comment.id)
+        )
+
+    def test_serializers_bounded(self):
+        for _ in range(SCHEMA_CACHE_SIZE + 1):
+            get_serializer(UserSchema())
+
+        info = get_serializer.cache_info()
+        self.assertEqual(info.currsize, SCHEMA_CACHE_SIZE)
+        self.assertIs(get_serializer(post_schema), get_serializer(post_schema))
+
+
+if __name__ == '__main__':
+    unittest.main()
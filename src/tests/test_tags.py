@@ -40,6 +40,51 @@ class TagsTest(AuthorizedTestCase):
             'ruby',
         ])
 
+    def test_tags_follow_post_changes(self):
+        user = User(**self.user)
+        user.save()
+        post1 = Post(**self.post, owner_id=user.id, tags=['java', 'python'])
+        post1.save()
+        post2 = Post(**self.post, owner_id=user.id, tags=['ruby', 'python'])
+        post2.save()
+        post3 = Post(**self.post, owner_id=user.id, tags=['aws'])
+        post3.save()
+
+        post1.update(tags=['aws', 'ml'])
+        post2.delete()
+
+        res = self.client.get('/tags')
+        self.assertEqual(res.json, ['aws', 'ml'])
+
+    def test_tags_limited(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(**self.post, owner_id=user.id, tags=['java', 'python'])
+        post.save()
+        post = Post(**self.post, owner_id=user.id, tags=['python', 'aws'])
+        post.save()
+
+        res = self.client.get('/tags?limit=2')
+        self.assertEqual(res.json, ['python', 'aws'])
+
+        # Out of range limits are clamped
+        res = self.client.get('/tags?limit=-1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json, ['python'])
+        res = self.client.get('/tags?limit=1000')
+        self.assertEqual(res.json, ['python', 'aws', 'java'])
+
+    def test_all_tags_by_default(self):
+        user = User(**self.user)
+        user.save()
+        tags = [f'tag{i:03}' for i in range(101)]
+        post = Post(**self.post, owner_id=user.id, tags=tags)
+        post.save()
+
+        res = self.client.get('/tags')
+
+        self.assertEqual(res.json, tags)
+
 
 if __name__ == '__main__':
     unittest.main()
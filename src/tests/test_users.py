@@ -3,8 +3,16 @@ from src.tests.base import BaseTestCase, AuthorizedTestCase
 from src.models import User, Post
 import io
 import os
+import hashlib
 import tempfile
+from unittest.mock import patch
 from flask import current_app
+from sqlalchemy import event
+from src.app import db
+from src.extensions import user_cache, revocation_store
+from src.utils import LazyUser
+from flask_jwt_extended import create_access_token, create_refresh_token, \
+    current_user, verify_jwt_in_request, decode_token
 
 
 class AuthTest(BaseTestCase):
@@ -16,6 +24,7 @@ class AuthTest(BaseTestCase):
         self.assertEqual(res.status_code, 201)
         self.assertEqual(res.json['username'], self.user['username'])
         self.assertIn('token', res.json)
+        self.assertIn('refresh_token', res.json)
 
     def test_user_creation_with_existing_email(self):
         user = User('A', 'a', 'tester@mail.com', 'pass')
@@ -63,6 +72,116 @@ class AuthTest(BaseTestCase):
         self.assertEqual(res.json['username'], self.user['username'])
         self.assertIn('token', res.json)
 
+    def test_token_refreshed(self):
+        user = User(**self.user)
+        user.save()
+        res = self.client.post('/login', json={
+            'email': self.user['email'],
+            'password': self.user['password']
+        })
+        refresh_token = res.json['refresh_token']
+        revocation_store.is_revoked(decode_token(refresh_token)['jti'])
+        user_cache.clear()
+        db.session.expunge_all()
+
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            res = self.client.post(
+                '/token/refresh',
+                headers={'Authorization': f'Bearer {refresh_token}'}
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.status_code, 200)
+        # Only the rotated token's revocation, the user isn't loaded
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT INTO revoked_tokens'))
+        self.assertIn('refresh_token', res.json)
+
+        res = self.client.get(
+            '/me',
+            headers={'Authorization': f"Bearer {res.json['token']}"}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['username'], self.user['username'])
+
+    def test_refreshed_token_claims_carried(self):
+        user = User(**self.user)
+        user.save()
+        refresh_token = create_refresh_token(identity=user)
+
+        res = self.client.post(
+            '/token/refresh',
+            headers={'Authorization': f'Bearer {refresh_token}'}
+        )
+        token = decode_token(res.json['token'])
+
+        self.assertEqual(token['identity'], user.id)
+        self.assertEqual(token['user_claims'], {'username': 'tester'})
+
+    def test_refresh_token_rotated(self):
+        user = User(**self.user)
+        user.save()
+        refresh_token = create_refresh_token(identity=user)
+        headers = {'Authorization': f'Bearer {refresh_token}'}
+
+        res = self.client.post('/token/refresh', headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.post('/token/refresh', headers=headers)
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json['message'], 'Token has been revoked')
+
+    def test_user_logged_out(self):
+        user = User(**self.user)
+        user.save()
+        token = create_access_token(identity=user)
+        refresh_token = create_refresh_token(identity=user)
+        headers = {'Authorization': f'Bearer {token}'}
+
+        res = self.client.post(
+            '/logout',
+            headers=headers,
+            json={'refresh_token': refresh_token}
+        )
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get('/me', headers=headers)
+        self.assertEqual(res.status_code, 401)
+        res = self.client.post(
+            '/token/refresh',
+            headers={'Authorization': f'Bearer {refresh_token}'}
+        )
+        self.assertEqual(res.status_code, 401)
+
+        # Tokens issued afterwards aren't affected
+        res = self.client.get('/me', headers={
+            'Authorization': f'Bearer {create_access_token(identity=user)}'
+        })
+        self.assertEqual(res.status_code, 200)
+
+    def test_token_not_refreshed_with_access_token(self):
+        user = User(**self.user)
+        user.save()
+
+        token = create_access_token(identity=user)
+        res = self.client.post(
+            '/token/refresh',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+
+        # Wrong token types go through the invalid token handler
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json, {
+            'message': 'Signature verification failed.'
+        })
+
     def test_user_login_with_wrong_credentials(self):
         credentials = {
             'email': 'something@mail.com',
@@ -102,6 +221,19 @@ class UserTest(AuthorizedTestCase):
             'picture': None
         })
 
+    def test_user_profile_with_posts(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(title='A', description='B', contents='C', owner_id=user.id)
+        post.save()
+        res = self.client.get(f"/@{user.username}?include=posts")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in res.json['posts']],
+            [post.id]
+        )
+        self.assertNotIn('author', res.json['posts'][0])
+
     def test_user_profile_not_found(self):
         res = self.client.get('/@someone')
         self.assertEqual(res.status_code, 404)
@@ -144,6 +276,29 @@ class UserTest(AuthorizedTestCase):
         self.assertEqual(posts[0]['description'], post.description)
         self.assertEqual(posts[0]['contents'], post.contents)
 
+    def test_user_get_me_with_favorited_posts(self):
+        user = User(**self.user)
+        user.save()
+        post = {
+            'title': 'A',
+            'description': 'B',
+            'contents': 'C'
+        }
+        post1 = Post(**post, owner_id=user.id)
+        post1.favorited_by = [user]
+        post1.save()
+        post2 = Post(**post, owner_id=user.id)
+        post2.save()
+        res = self.authorized_get(
+            '/me?include=posts',
+            user
+        )
+
+        favorites = {
+            post['id']: post['is_favorited'] for post in res.json['posts']
+        }
+        self.assertEqual(favorites, {post1.id: True, post2.id: False})
+
     def test_user_updated(self):
         UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
         temp = tempfile.NamedTemporaryFile(
@@ -175,6 +330,238 @@ class UserTest(AuthorizedTestCase):
             os.path.join(UPLOADS_FOLDER, old_avatar)
         ))
 
+    def upload_picture(self, user, contents, filename='test.jpg'):
+        return self.authorized_put(
+            '/me',
+            user,
+            data={'picture': (io.BytesIO(contents), filename)},
+            content_type='multipart/form-data'
+        )
+
+    def test_picture_named_after_contents(self):
+        UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
+        user = User(**self.user)
+        user.save()
+
+        res = self.upload_picture(user, b'abcdef')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            user.avatar,
+            f"{hashlib.sha256(b'abcdef').hexdigest()}.jpg"
+        )
+
+        # Uploading it again keeps the file
+        res = self.upload_picture(user, b'abcdef')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(os.listdir(UPLOADS_FOLDER).count(user.avatar), 1)
+
+    def test_shared_picture_not_deleted(self):
+        UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
+        user = User(**self.user)
+        user.save()
+        other = User(
+            name='Other',
+            username='other',
+            email='other@mail.com',
+            password='secret'
+        )
+        other.save()
+        self.upload_picture(user, b'abcdef')
+        self.upload_picture(other, b'abcdef')
+
+        self.upload_picture(user, b'ghijkl')
+        self.assertTrue(os.path.exists(
+            os.path.join(UPLOADS_FOLDER, other.avatar)
+        ))
+
+    def test_deleted_picture_replaced(self):
+        UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
+        user = User(**self.user)
+        user.save()
+        self.upload_picture(user, b'abcdef')
+        # Deleted elsewhere, e.g. by a request that raced this one
+        os.remove(os.path.join(UPLOADS_FOLDER, user.avatar))
+
+        res = self.upload_picture(user, b'ghijkl')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(os.path.exists(
+            os.path.join(UPLOADS_FOLDER, user.avatar)
+        ))
+
+    def test_picture_rewritten_if_deleted_before_lock(self):
+        UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
+        user = User(**self.user)
+        user.save()
+        lock_avatar = User.lock_avatar
+
+        # Another user's request deletes it between saving and locking
+        def delete_then_lock(avatar):
+            os.remove(os.path.join(UPLOADS_FOLDER, avatar))
+            lock_avatar(avatar)
+
+        with patch.object(User, 'lock_avatar', delete_then_lock):
+            res = self.upload_picture(user, b'abcdef')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(os.path.exists(
+            os.path.join(UPLOADS_FOLDER, user.avatar)
+        ))
+
+    def test_picture_too_large(self):
+        UPLOADS_FOLDER = current_app.config['UPLOADS_FOLDER']
+        self.app.config['AVATAR_MAX_SIZE'] = 4
+        user = User(**self.user)
+        user.save()
+
+        res = self.upload_picture(user, b'abcdef')
+        self.assertEqual(res.status_code, 413)
+        self.assertEqual(res.json['message'], 'File too large')
+        self.assertEqual(user.avatar, '')
+        self.assertEqual([
+            f for f in os.listdir(UPLOADS_FOLDER)
+            if not f.endswith('.gitignore')
+        ], [])
+
+    def test_request_too_large(self):
+        self.app.config['MAX_CONTENT_LENGTH'] = 64
+        user = User(**self.user)
+        user.save()
+
+        res = self.upload_picture(user, b'a' * 128)
+        self.assertEqual(res.status_code, 413)
+
+    def test_user_loaded_from_cache(self):
+        user = User(**self.user)
+        user.save()
+        self.authorized_get('/me', user)
+        db.session.expunge_all()
+
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            res = self.authorized_get('/me', user)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.json['username'], self.user['username'])
+        self.assertEqual(statements, [])
+
+    def test_user_cache_invalidated(self):
+        user = User(**self.user)
+        user.save()
+        self.authorized_get('/me', user)
+
+        user.update(name='Renamed')
+        db.session.expunge_all()
+        res = self.authorized_get('/me', user)
+
+        self.assertEqual(res.json['name'], 'Renamed')
+
+    def test_user_lazily_loaded(self):
+        user = User(**self.user)
+        user.save()
+        token = create_access_token(identity=user)
+
+        with self.app.test_request_context(
+            headers={'Authorization': f'Bearer {token}'}
+        ):
+            verify_jwt_in_request()
+            lazy_user = current_user._get_current_object()
+
+            self.assertIsInstance(lazy_user, LazyUser)
+            self.assertEqual(lazy_user.id, user.id)
+            self.assertEqual(lazy_user.username, user.username)
+            self.assertIsNone(lazy_user._user)
+            self.assertEqual(lazy_user.email, user.email)
+            self.assertIsNotNone(lazy_user._user)
+
+    def test_claims_outdated_by_user(self):
+        user = User(**self.user)
+        user.save()
+        token = create_access_token(identity=user)
+        headers = {'Authorization': f'Bearer {token}'}
+
+        res = self.client.put(
+            '/me',
+            headers=headers,
+            data={'username': 'renamed'},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(res.json['username'], 'renamed')
+
+        res = self.client.get('/me', headers=headers)
+        self.assertEqual(res.json['username'], 'renamed')
+
+    def test_deleted_user_cannot_write(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(
+            title='Test post',
+            description='Test description',
+            contents='Test contents',
+            owner_id=user.id
+        )
+        post.save()
+        other = User(
+            name='Other',
+            username='other',
+            email='other@mail.com',
+            password='secret'
+        )
+        other.save()
+        token = create_access_token(identity=other)
+        headers = {'Authorization': f'Bearer {token}'}
+        other.delete()
+
+        requests = [
+            ('post', '/posts', {
+                'title': 'Test post',
+                'description': 'Test description',
+                'contents': 'Test contents'
+            }),
+            ('post', f'/posts/{post.id}/comments', {'contents': 'Hi'}),
+            ('post', f'/posts/{post.id}/favorite', None),
+            ('delete', f'/posts/{post.id}/favorite', None)
+        ]
+        for method, url, data in requests:
+            res = getattr(self.client, method)(url, headers=headers, json=data)
+            self.assertEqual(res.status_code, 401)
+            self.assertEqual(res.json['message'], 'User not found')
+
+    def test_public_read_without_user_lookup(self):
+        user = User(**self.user)
+        user.save()
+        post = Post(
+            title='Test post',
+            description='Test description',
+            contents='Test contents',
+            owner_id=user.id
+        )
+        post.favorited_by = [user]
+        post.save()
+        db.session.refresh(user)
+        user_cache.clear()
+        db.session.expunge_all()
+
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            res = self.authorized_get('/posts', user)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.json['data'][0]['is_favorited'], True)
+        self.assertFalse(any('FROM users' in s for s in statements))
+
     def test_user_not_authenticated(self):
         res = self.client.get('/me')
         self.assertEqual(res.status_code, 401)
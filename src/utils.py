@@ -1,16 +1,68 @@
+from flask_jwt_extended import get_jwt_claims
 from src.models import User
+from src.exceptions import InvalidUsage
+from src.extensions import revocation_store
+from functools import partial
 import os
-import uuid
+import hashlib
+import tempfile
+
+
+class LazyUser(object):
+    """Stands in for the user of the current token.
+
+    The id and the claims carried by the token are read without touching
+    the database, the user is only loaded once anything else is needed.
+    """
+    __slots__ = ('id', '_claims', '_user')
+
+    def __init__(self, _id, claims):
+        self.id = _id
+        self._claims = claims
+        self._user = None
+
+    def __getattr__(self, name):
+        # Claims may be outdated, the row is the authority once loaded
+        if self._user is None and name in self._claims:
+            return self._claims[name]
+        return getattr(self.get_user(), name)
+
+    def get_user(self):
+        """Load the user, failing with a 401 when they no longer exist.
+
+        Writes referring to the user need it, the token alone doesn't
+        prove they weren't deleted since.
+        """
+        if self._user is None:
+            self._user = User.get_cached(self.id)
+            if self._user is None:
+                raise InvalidUsage(401, 'User not found')
+        return self._user
+
+
+# Claims available from the token on top of the id
+USER_CLAIMS = ('username',)
 
 
 def user_loader(_id):
-    return User.get_one(_id)
+    claims = get_jwt_claims()
+    return LazyUser(_id, {
+        claim: claims[claim] for claim in USER_CLAIMS if claim in claims
+    })
 
 
 def identity_loader(user):
     return user.id
 
 
+def claims_loader(user):
+    return {claim: getattr(user, claim) for claim in USER_CLAIMS}
+
+
+def token_in_blacklist(token):
+    return revocation_store.is_revoked(token['jti'], token.get('exp'))
+
+
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
 
 
@@ -19,17 +71,56 @@ def allowed_file(filename, allowed_extensions):
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
-def save_file(file, path, allowed_extensions=ALLOWED_EXTENSIONS):
-    if allowed_file(file.filename, allowed_extensions):
-        extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{uuid.uuid4().hex}.{extension}"
+# Uploads are copied in chunks of this size, never read whole
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def save_file(
+    file,
+    path,
+    allowed_extensions=ALLOWED_EXTENSIONS,
+    max_size=None
+):
+    if not allowed_file(file.filename, allowed_extensions):
+        return None
+
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    digest = hashlib.sha256()
+    size = 0
 
-        file.save(os.path.join(path, filename))
+    # Written next to its final location, so moving it there is an
+    # atomic rename and a partial file is never served
+    temp = tempfile.NamedTemporaryFile(
+        dir=path,
+        prefix='.upload-',
+        delete=False
+    )
+    try:
+        with temp:
+            chunks = iter(partial(file.stream.read, UPLOAD_CHUNK_SIZE), b'')
+            for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise InvalidUsage(413, 'File too large')
+                digest.update(chunk)
+                temp.write(chunk)
+            temp.flush()
+            os.fsync(temp.fileno())
+        os.chmod(temp.name, 0o644)
 
-        return filename
+        # Named after its contents, the same file always gets the same name
+        filename = f"{digest.hexdigest()}.{extension}"
+        os.replace(temp.name, os.path.join(path, filename))
+    except BaseException:
+        os.remove(temp.name)
+        raise
 
-    return None
+    return filename
 
 
 def delete_file(path, filename):
-    os.remove(os.path.join(path, filename))
+    # Gone already if a concurrent request deleted it first
+    try:
+        os.remove(os.path.join(path, filename))
+    except FileNotFoundError:
+        pass